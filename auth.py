@@ -3,16 +3,45 @@
 These dialogs are small UI helpers: one for initial setup (create a
 master password and show a QR code for TOTP) and a login dialog that
 asks for the master password and the one-time code.
+`run_in_background()` keeps the UI responsive while the keys these
+dialogs ask for are derived.
 """
 
-from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QMessageBox
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QDialogButtonBox, QMessageBox, QProgressDialog
 from PySide6.QtGui import QPixmap
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QEventLoop, QTimer
 import pyotp
 import qrcode
 from io import BytesIO
 
 
+def run_in_background(label, fn, *args):
+    """Run ``fn(*args)`` on a worker thread while showing a busy dialog.
+
+    The Qt event loop keeps running so the UI stays responsive during
+    slow work such as Argon2 key derivation. Returns the result of
+    ``fn`` or re-raises its exception.
+    """
+    progress = QProgressDialog(label, "", 0, 0)
+    progress.setWindowTitle("MyJourney")
+    progress.setCancelButton(None)
+    progress.setWindowModality(Qt.WindowModality.ApplicationModal)
+    progress.setMinimumDuration(0)
+    progress.show()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(fn, *args)
+        loop = QEventLoop()
+        poll = QTimer()
+        poll.setInterval(20)
+        poll.timeout.connect(lambda: loop.quit() if future.done() else None)
+        poll.start()
+        loop.exec()
+        poll.stop()
+    progress.close()
+    return future.result()
+
+
 class SetupDialog(QDialog):
     """Initial setup dialog.
 
@@ -82,4 +111,36 @@ class LoginDialog(QDialog):
         buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
-        layout.addWidget(buttons)
\ No newline at end of file
+        layout.addWidget(buttons)
+
+class ChangePasswordDialog(QDialog):
+    """Ask for the current master password and a new one (with confirmation)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("MyJourney - Change Password")
+        layout = QVBoxLayout(self)
+        self.current = QLineEdit()
+        self.current.setEchoMode(QLineEdit.EchoMode.Password)
+        self.pw1 = QLineEdit()
+        self.pw1.setEchoMode(QLineEdit.EchoMode.Password)
+        self.pw2 = QLineEdit()
+        self.pw2.setEchoMode(QLineEdit.EchoMode.Password)
+        layout.addWidget(QLabel("Current master password:"))
+        layout.addWidget(self.current)
+        layout.addWidget(QLabel("New master password:"))
+        layout.addWidget(self.pw1)
+        layout.addWidget(QLabel("Confirm new password:"))
+        layout.addWidget(self.pw2)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.validate)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def validate(self):
+        """Check that the new password fields match and are not empty."""
+        if self.pw1.text() == self.pw2.text() and self.pw1.text():
+            self.password: str = self.pw1.text()
+            self.accept()
+        else:
+            QMessageBox.warning(self, "Error", "New passwords do not match or are empty.")
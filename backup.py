@@ -0,0 +1,498 @@
+"""Encrypted, streaming backups of the journal database.
+
+A backup is a consistent snapshot of the database file (taken with
+SQLite's online backup API, see `DatabaseManager.snapshot()`) encrypted
+in fixed-size chunks, so memory use stays flat however large the
+journal is. The file layout is::
+
+    header: b"MJBACKUP" | version | kind | 16-byte salt | 7-byte nonce prefix
+    chunks: 4-byte big-endian length | AES-GCM ciphertext + tag
+
+The key is derived from a backup password (independent of the master
+password) and the salt. Chunk ``n`` is sealed with the nonce
+``prefix | n | last`` and the header as associated data, so chunks
+cannot be reordered, dropped, truncated at a chunk boundary or moved
+between backups without the reader noticing.
+
+A full backup holds a whole snapshot. An incremental (delta) backup
+holds only the rows changed since the previous backup (tracked by the
+``changes`` table, see migrations.py), as a small SQLite database with
+the same tables. Each backup carries a ``backup_info`` table naming
+itself and the backup it follows, so `restore_backups()` can put a
+base and its deltas in order, whatever order they are given in, and
+check that they form one chain before replaying them. Run
+``python backup.py OUTPUT BASE [DELTA ...]`` to restore from the
+command line.
+
+Backups made before this format (a salt followed by one Fernet token of
+the whole file) can still be restored, but are decrypted in memory.
+"""
+
+import os
+import sys
+import uuid
+import sqlite3
+import struct
+import getpass
+import argparse
+import tempfile
+import threading
+from typing import BinaryIO, Callable, Optional
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from PySide6.QtCore import QObject, Signal
+from encryption import EncryptionManager
+from migrations import TRACKED_TABLES
+
+BACKUP_MAGIC = b"MJBACKUP"
+BACKUP_VERSION = 1
+# what the encrypted stream holds
+KIND_FULL = 0
+KIND_DELTA = 1
+# plaintext bytes per chunk
+BACKUP_CHUNK_SIZE = 1024 * 1024
+_HEADER = struct.Struct(">8sBB16s7s")
+_LENGTH = struct.Struct(">I")
+_TAG_SIZE = 16
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+def backup_key(password: str, salt: bytes) -> bytes:
+    """Derive the backup encryption key (slow: runs Argon2)."""
+    return EncryptionManager(password, salt).derive_subkey("backup")
+
+
+def encrypt_stream(src: BinaryIO, dst: BinaryIO, password: str, kind: int = KIND_FULL,
+                   total: Optional[int] = None, progress: Optional[Callable[[int, int], None]] = None,
+                   cancelled: Optional[Callable[[], bool]] = None):
+    """Encrypt everything readable from ``src`` into a backup written to ``dst``.
+
+    ``progress(done, total)`` is called after each chunk with plaintext
+    byte counts (``total`` is 0 if not given). If ``cancelled()``
+    returns True, stops with `BackupCancelled`; ``dst`` is then incomplete.
+    """
+    salt = EncryptionManager.generate_salt()
+    prefix = os.urandom(7)
+    header = _HEADER.pack(BACKUP_MAGIC, BACKUP_VERSION, kind, salt, prefix)
+    aead = AESGCM(backup_key(password, salt))
+    dst.write(header)
+    done = 0
+    index = 0
+    chunk = src.read(BACKUP_CHUNK_SIZE)
+    while True:
+        if cancelled is not None and cancelled():
+            raise BackupCancelled
+        # read ahead one chunk so the last one can be marked as such
+        following = src.read(BACKUP_CHUNK_SIZE) if chunk else b""
+        last = not following
+        sealed = aead.encrypt(_nonce(prefix, index, last), chunk, header)
+        dst.write(_LENGTH.pack(len(sealed)))
+        dst.write(sealed)
+        done += len(chunk)
+        index += 1
+        if progress is not None:
+            progress(done, total or 0)
+        if last:
+            return
+        chunk = following
+
+
+def decrypt_stream(src: BinaryIO, dst: BinaryIO, password: str,
+                   progress: Optional[Callable[[int], None]] = None) -> int:
+    """Decrypt a backup from ``src`` into ``dst``, verifying each chunk.
+
+    Returns the backup's kind. ``progress(done)`` is called after each
+    chunk with the backup bytes read so far. Raises ValueError if the
+    file is not a backup, the password is wrong or the backup has been
+    damaged or truncated; ``dst`` may then hold a partial result.
+    """
+    header = src.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise ValueError("Not a MyJourney backup.")
+    magic, version, kind, salt, prefix = _HEADER.unpack(header)
+    if magic != BACKUP_MAGIC:
+        raise ValueError("Not a MyJourney backup.")
+    if version != BACKUP_VERSION:
+        raise ValueError(f"Unsupported backup version {version}.")
+    aead = AESGCM(backup_key(password, salt))
+    done = len(header)
+    index = 0
+    while True:
+        length = src.read(_LENGTH.size)
+        if len(length) != _LENGTH.size:
+            raise ValueError("The backup is truncated.")
+        (size,) = _LENGTH.unpack(length)
+        if size < _TAG_SIZE or size > BACKUP_CHUNK_SIZE + _TAG_SIZE:
+            raise ValueError("The backup is damaged.")
+        sealed = src.read(size)
+        if len(sealed) != size:
+            raise ValueError("The backup is truncated.")
+        chunk = None
+        for last in (False, True):
+            try:
+                chunk = aead.decrypt(_nonce(prefix, index, last), sealed, header)
+                break
+            except InvalidTag:
+                continue
+        if chunk is None:
+            raise ValueError("Wrong password, or the backup is damaged." if index == 0
+                             else "The backup is damaged.")
+        dst.write(chunk)
+        done += _LENGTH.size + size
+        index += 1
+        if progress is not None:
+            progress(done)
+        if last:
+            if src.read(1):
+                raise ValueError("The backup has unexpected data after its end.")
+            return kind
+
+
+def _stamp(path: str, backup_id: str, parent: str | None, kind: int, seq: int | None = None) -> dict:
+    """Record in the plaintext backup database at ``path`` which backup it is.
+
+    ``seq`` defaults to the newest change in the database. Returns the
+    stored info.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        if seq is None:
+            seq = conn.execute("SELECT IFNULL(MAX(seq), 0) FROM changes").fetchone()[0]
+        info = {"id": backup_id, "parent": parent, "kind": kind, "seq": seq,
+                "schema_version": conn.execute("PRAGMA user_version").fetchone()[0]}
+        conn.execute("DROP TABLE IF EXISTS backup_info")
+        conn.execute("CREATE TABLE backup_info (id TEXT, parent TEXT, kind INTEGER, seq INTEGER, schema_version INTEGER)")
+        conn.execute("INSERT INTO backup_info VALUES (:id, :parent, :kind, :seq, :schema_version)", info)
+        conn.commit()
+    finally:
+        conn.close()
+    return info
+
+
+def _backup_info(conn: sqlite3.Connection, schema: str = "main") -> dict:
+    row = conn.execute(f"SELECT id, parent, kind, seq, schema_version FROM {schema}.backup_info").fetchone()
+    return dict(zip(("id", "parent", "kind", "seq", "schema_version"), row))
+
+
+def apply_delta(conn: sqlite3.Connection, delta_path: str):
+    """Replay the decrypted delta at ``delta_path`` onto the restored database ``conn``.
+
+    Raises ValueError unless the delta directly follows the backup
+    ``conn`` currently holds.
+    """
+    conn.execute("ATTACH DATABASE ? AS delta", (delta_path,))
+    try:
+        current, delta = _backup_info(conn), _backup_info(conn, "delta")
+        if delta["kind"] != KIND_DELTA or delta["parent"] != current["id"]:
+            raise ValueError("The incremental backups do not follow on from each other; "
+                             "pass them in the order they were made, starting after the full backup.")
+        if delta["schema_version"] != current["schema_version"]:
+            raise ValueError("An incremental backup was made by a different version of MyJourney.")
+        # the replay must not be logged as new changes by the tracking
+        # triggers; the delta's own change log is copied in below
+        triggers = conn.execute("SELECT name, sql FROM main.sqlite_master "
+                                "WHERE type = 'trigger' AND name LIKE 'track!_%' ESCAPE '!'").fetchall()
+        with conn:
+            conn.execute("BEGIN")
+            for name, _ in triggers:
+                conn.execute(f"DROP TRIGGER main.{name}")
+            # deletes first: a changed row is replaced, a deleted one is just gone
+            for table, (tbl, key, _) in TRACKED_TABLES.items():
+                conn.execute(f"DELETE FROM main.{table} WHERE {key} IN "
+                             "(SELECT row_key FROM delta.changes WHERE tbl = ?)", (tbl,))
+            for table in TRACKED_TABLES:
+                cols = ", ".join(r[1] for r in conn.execute(f"PRAGMA delta.table_info({table})"))
+                conn.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM delta.{table}")
+            # the search index is not part of deltas; rebuild it for changed entries
+            changed = "(SELECT row_key FROM delta.changes WHERE tbl = 'entries')"
+            conn.execute(f"DELETE FROM main.search_index WHERE entry_id IN {changed}")
+            conn.execute(f"UPDATE main.entries SET indexed = 0 WHERE id IN {changed}")
+            conn.execute("INSERT OR REPLACE INTO main.changes (tbl, row_key, seq) SELECT tbl, row_key, seq FROM delta.changes")
+            conn.execute("UPDATE main.backup_info SET id = ?, parent = ?, kind = ?, seq = ?",
+                         (delta["id"], delta["parent"], delta["kind"], delta["seq"]))
+            for _, sql in triggers:
+                conn.execute(sql)
+    finally:
+        conn.execute("DETACH DATABASE delta")
+
+
+def _header_kind(path: str) -> int | None:
+    """Return the kind in the header of the backup at ``path``, or None if it has no header."""
+    with open(path, "rb") as src:
+        header = src.read(_HEADER.size)
+    if len(header) != _HEADER.size or not header.startswith(BACKUP_MAGIC):
+        return None
+    return _HEADER.unpack(header)[2]
+
+
+def restore_backups(paths: list[str], password: str, dest: str,
+                    progress: Optional[Callable[[int, int], None]] = None):
+    """Rebuild a journal database at ``dest`` from a full backup and its deltas.
+
+    ``paths`` holds one full backup and the incremental backups made
+    after it, in any order: the deltas are replayed along the chain of
+    parent links they record, not by name or file date. ``progress(done,
+    total)`` is called with backup bytes processed. Raises ValueError if
+    a file is not a backup, the password is wrong, a file is damaged or
+    the files do not form one chain.
+    """
+    kinds = {path: _header_kind(path) for path in paths}
+    legacy = [path for path in paths if kinds[path] is None]
+    if legacy:
+        if len(paths) > 1:
+            raise ValueError(f"{os.path.basename(legacy[0])} is an old-style backup; it cannot have incremental backups.")
+        _restore_legacy(paths[0], password, dest)
+        return
+    full = [path for path in paths if kinds[path] == KIND_FULL]
+    if not full:
+        raise ValueError(f"{os.path.basename(paths[0])} is an incremental backup; start with a full backup.")
+    if len(full) > 1:
+        raise ValueError("Select only one full backup; incremental backups build on a single one.")
+    total = sum(os.path.getsize(p) for p in paths)
+    offset = 0
+
+    def report(done: int):
+        if progress is not None:
+            progress(offset + done, total)
+
+    with open(full[0], "rb") as src, open(dest, "wb") as dst:
+        if decrypt_stream(src, dst, password, report) != KIND_FULL:
+            raise ValueError(f"{os.path.basename(full[0])} is an incremental backup; start with a full backup.")
+    offset += os.path.getsize(full[0])
+    decrypted = []
+    conn = sqlite3.connect(dest)
+    try:
+        # id of the backup a delta follows -> (the delta's id, file, decrypted copy)
+        following = {}
+        for path in paths:
+            if path == full[0]:
+                continue
+            fd, delta = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(dest)))
+            decrypted.append(delta)
+            with os.fdopen(fd, "wb") as dst, open(path, "rb") as src:
+                decrypt_stream(src, dst, password, report)
+            offset += os.path.getsize(path)
+            info_conn = sqlite3.connect(delta)
+            try:
+                info = _backup_info(info_conn)
+            finally:
+                info_conn.close()
+            # the same backup selected twice (e.g. a copy) is replayed once
+            other = following.setdefault(info["parent"], (info["id"], path, delta))
+            if other[0] != info["id"]:
+                raise ValueError(f"{os.path.basename(path)} and {os.path.basename(other[1])} follow the same backup; "
+                                 "select the incremental backups of one journal only.")
+        chain = []
+        current = _backup_info(conn)["id"]
+        while current in following:
+            current, _, delta = following.pop(current)
+            chain.append(delta)
+        if following:
+            stray = next(iter(following.values()))[1]
+            raise ValueError(f"{os.path.basename(stray)} does not follow on from the full backup; "
+                             "an incremental backup made between them is missing.")
+        for delta in chain:
+            apply_delta(conn, delta)
+        # the restored journal starts a new backup chain
+        with conn:
+            conn.execute("DROP TABLE backup_info")
+            conn.execute("DELETE FROM backups")
+    finally:
+        conn.close()
+        for delta in decrypted:
+            os.remove(delta)
+
+
+def _restore_legacy(path: str, password: str, dest: str):
+    """Decrypt a backup written as ``salt + Fernet(database)`` (held in memory)."""
+    with open(path, "rb") as src:
+        data = src.read()
+    try:
+        plain = EncryptionManager(password, data[:16]).decrypt_data(data[16:])
+    except Exception:
+        raise ValueError("Not a MyJourney backup, or the password is wrong.") from None
+    with open(dest, "wb") as dst:
+        dst.write(plain)
+
+
+def check_database(path: str):
+    """Raise ValueError unless ``path`` holds an intact journal database."""
+    conn = sqlite3.connect(path)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if problems != ["ok"]:
+            raise ValueError("The restored database is damaged: " + "; ".join(problems[:3]))
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'config'").fetchone() is None \
+                or conn.execute("SELECT 1 FROM config").fetchone() is None:
+            raise ValueError("The backup does not contain a journal.")
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"The restored database is damaged: {e}") from None
+    finally:
+        conn.close()
+
+
+class RestoreJob(QObject):
+    """Restore backups into a new database file on a background thread.
+
+    ``paths`` are a full backup and its incremental backups, in any
+    order (see `restore_backups()`). The result is written to a temporary file next to
+    ``db_path`` and checked with `check_database()`; ``finished`` is
+    emitted with its path, ready for `DatabaseManager.replace_with()`.
+    ``progress`` and ``failed`` work as for `BackupJob`. Nothing is left
+    behind on failure.
+    """
+
+    progress = Signal(int, int)
+    finished = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, paths: list[str], password: str, db_path: str, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.password = password
+        self.db_path = db_path
+        self._thread = threading.Thread(target=self._run, name="RestoreJob", daemon=True)
+
+    def start(self):
+        """Start restoring; returns immediately."""
+        self._thread.start()
+
+    def wait(self):
+        """Block until the restore has finished or failed."""
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        fd, restored = tempfile.mkstemp(suffix=".restore.db", dir=os.path.dirname(os.path.abspath(self.db_path)))
+        os.close(fd)
+        try:
+            restore_backups(self.paths, self.password, restored, self.progress.emit)
+            check_database(restored)
+        except Exception as e:
+            for leftover in (restored, restored + "-wal", restored + "-shm"):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+            self.failed.emit(str(e) or type(e).__name__)
+        else:
+            self.finished.emit(restored)
+
+
+class BackupCancelled(Exception):
+    """Raised by `encrypt_stream()` when asked to stop."""
+
+
+class BackupJob(QObject):
+    """Write an encrypted backup of ``db`` to ``path`` on a background thread.
+
+    With ``incremental`` only the rows changed since the last backup
+    are written; this fails if there is no earlier backup of the
+    current schema to build on. ``progress`` is emitted with work done
+    and the total, ``finished`` with the backup path and ``failed``
+    with an error message. The backup is written next to ``path`` and
+    renamed into place only when complete.
+    """
+
+    progress = Signal(int, int)
+    finished = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, db, path: str, password: str, incremental: bool = False, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.path = path
+        self.password = password
+        self.incremental = incremental
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="BackupJob", daemon=True)
+
+    def start(self):
+        """Start the backup; returns immediately."""
+        self._thread.start()
+
+    def cancel(self):
+        """Ask the backup to stop soon; ``failed`` reports "Backup cancelled"."""
+        self._stop.set()
+
+    def stop(self):
+        """Cancel the backup and wait for the thread; no file is left behind."""
+        self.cancel()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _snapshot_progress(self, done: int, total: int):
+        if self._stop.is_set():
+            raise BackupCancelled
+        if total:
+            self.progress.emit(done, 2 * total)
+
+    def _run(self):
+        fd, snapshot = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(self.db.path)))
+        os.close(fd)
+        partial = self.path + ".part"
+        try:
+            backup_id = uuid.uuid4().hex
+            if self.incremental:
+                last = self.db.last_backup()
+                if last is None or last["schema_version"] != self.db.schema_version():
+                    raise ValueError("There is no earlier backup of this journal to build on; make a full backup first.")
+                seq = self.db.export_changes(snapshot, last["seq"])
+                info = _stamp(snapshot, backup_id, last["id"], KIND_DELTA, seq)
+            else:
+                # the snapshot (in pages) fills the first half of the range, encryption (in bytes) the second
+                self.db.snapshot(snapshot, self._snapshot_progress)
+                info = _stamp(snapshot, backup_id, None, KIND_FULL)
+            size = os.path.getsize(snapshot)
+            with open(snapshot, "rb") as src, open(partial, "wb") as dst:
+                encrypt_stream(src, dst, self.password, info["kind"], total=size,
+                               progress=lambda done, total: self.progress.emit(total + done, 2 * total),
+                               cancelled=self._stop.is_set)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(partial, self.path)
+            self.db.record_backup(backup_id, info["parent"], info["kind"], info["seq"])
+        except BackupCancelled:
+            self.failed.emit("Backup cancelled")
+        except Exception as e:
+            self.failed.emit(str(e) or type(e).__name__)
+        else:
+            self.finished.emit(self.path)
+        finally:
+            self.db.release_reader()
+            for leftover in (snapshot, partial):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Restore a MyJourney journal from a full backup "
+                                                 "and any incremental backups made after it.")
+    parser.add_argument("output", help="journal file to create (must not exist)")
+    parser.add_argument("backups", nargs="+", help="the full backup and the incremental backups made after it, in any order")
+    args = parser.parse_args(argv)
+    if os.path.exists(args.output):
+        parser.error(f"{args.output} already exists")
+    password = getpass.getpass("Backup password: ")
+    try:
+        restore_backups(args.backups, password, args.output,
+                        lambda done, total: print(f"\r{done * 100 // total}%", end="", file=sys.stderr))
+        check_database(args.output)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"\nRestore failed: {e}", file=sys.stderr)
+        try:
+            os.remove(args.output)
+        except OSError:
+            pass
+        return 1
+    print(f"\nRestored to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
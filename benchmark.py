@@ -0,0 +1,277 @@
+"""Headless performance benchmark for MyJournal.
+
+Builds a synthetic journal (entries with realistic HTML bodies, inline
+base64 images and attachments) through `EncryptionManager` and
+`DatabaseManager`, then times the operations the app performs: key
+derivation at login, loading entries, saving, search, statistics and
+every export format. It also compares the ciphertext formats
+`EncryptionManager` can write (bulk decryption and attachment chunk
+throughput). Results are printed as JSON so runs on different commits
+can be compared.
+
+Usage::
+
+    python benchmark.py --entries 1000 --output results.json
+
+The generated journal is written to a temporary directory unless
+``--db`` is given; an existing file at that path is reused as-is so
+repeated runs skip generation.
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import date, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pyotp
+from PySide6.QtGui import QGuiApplication
+from encryption import EncryptionManager
+from database import DatabaseManager
+from entry import Entry
+from exporters import EXPORT_FORMATS
+from stats_dialog import compute_stats
+
+PASSWORD = "benchmark-password"
+WORDS = ("morning walk coffee meeting project garden weather family dinner "
+         "reading music travel quiet evening friends work idea plan river "
+         "mountain city train letter memory dream sunlight rain tired happy").split()
+TAGS = ["work", "family", "travel", "health", "ideas", "books", "music", "garden"]
+SEARCH_QUERIES = ["coffee", "mountain river", "sun", "xyzzy"]
+
+
+def _png(width: int, height: int, rng: random.Random) -> bytes:
+    """Return an RGB PNG of random noise (compresses like a photo would)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows))
+            + chunk(b"IEND", b""))
+
+
+def _paragraph(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(30, 90))]
+    words[0] = words[0].capitalize()
+    if rng.random() < 0.3:
+        i = rng.randrange(len(words))
+        words[i] = f"<b>{words[i]}</b>"
+    return "<p>" + " ".join(words) + ".</p>"
+
+
+def make_content(rng: random.Random, html_kb: int, image_size: int = 0) -> str:
+    """Return an entry body of roughly ``html_kb`` KiB of text HTML.
+
+    With a non-zero ``image_size`` an inline base64 PNG of that many
+    pixels square is embedded after the first paragraph.
+    """
+    paragraphs = []
+    while sum(map(len, paragraphs)) < html_kb * 1024:
+        paragraphs.append(_paragraph(rng))
+    if image_size:
+        data = base64.b64encode(_png(image_size, image_size, rng)).decode("ascii")
+        paragraphs.insert(1, f'<p><img src="data:image/png;base64,{data}" width="{image_size}" /></p>')
+    return ("<html><head><meta name=\"qrichtext\" content=\"1\" /></head>"
+            "<body style=\" font-family:'Segoe UI'; font-size:11pt;\">"
+            + "".join(paragraphs) + "</body></html>")
+
+
+def generate(path: str, args) -> None:
+    """Create a synthetic journal database at ``path``."""
+    rng = random.Random(args.seed)
+    salt = EncryptionManager.generate_salt()
+    enc = EncryptionManager(PASSWORD, salt).with_new_key(keep_previous=False)
+    db = DatabaseManager(path)
+    db.connect(enc)
+    db.init_db()
+    db.save_config(salt, pyotp.random_base32())
+    day = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.entries):
+            day -= timedelta(days=rng.choice((0, 1, 1, 2)))
+            with_image = args.images_every and i % args.images_every == 0
+            entry = Entry(None, day.isoformat(), " ".join(rng.choice(WORDS) for _ in range(3)).title(),
+                          make_content(rng, args.html_kb, args.image_size if with_image else 0),
+                          rng.sample(TAGS, rng.randint(0, 3)))
+            if args.attachments_every and i % args.attachments_every == 0:
+                att_path = os.path.join(tmp, f"attachment-{i}.bin")
+                with open(att_path, "wb") as f:
+                    f.write(rng.randbytes(args.attachment_kb * 1024))
+                entry.add_attachment(db.import_attachment(att_path))
+            db.save_entry(entry)
+    db.close()
+
+
+def timed(results: dict, name: str, fn, repeat: int):
+    """Run ``fn`` ``repeat`` times and record its timings under ``name``.
+
+    Returns the value of the last call.
+    """
+    times = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    results[name] = {
+        "runs": repeat,
+        "mean_ms": round(statistics.fmean(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+    return value
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(path: str, args) -> dict:
+    """Time the app's operations against the journal at ``path``."""
+    results = {}
+    db = DatabaseManager(path)
+    salt, _, wrapped_key = db.load_login_config()
+    enc = timed(results, "login_key_derivation", lambda: EncryptionManager(PASSWORD, salt, wrapped_key=wrapped_key),
+                args.repeat)
+    db.connect(enc)
+    timed(results, "init_db", db.init_db, args.repeat)
+
+    timed(results, "get_entry_summaries", lambda: db.get_entry_summaries(limit=200), args.repeat)
+    entries = timed(results, "get_all_entries", db.get_all_entries, args.repeat)
+
+    sample = entries[: min(len(entries), 20)]
+
+    def load_details():
+        for e in sample:
+            e.loaded = False
+            db.load_entry_details(e)
+    timed(results, "load_entry_details_x20", load_details, args.repeat)
+
+    rng = random.Random(args.seed + 1)
+
+    def save_content():
+        for e in sample:
+            e.content = make_content(rng, args.html_kb)
+            db.save_entry(e)
+    timed(results, "save_entry_content_x20", save_content, args.repeat)
+
+    def save_title():
+        for e in sample:
+            e.title = e.title + "!"
+            db.save_entry(e)
+    timed(results, "save_entry_title_x20", save_title, args.repeat)
+
+    for q in SEARCH_QUERIES:
+        timed(results, f"search[{q}]", lambda: db.search_entries(q), args.repeat)
+
+    def stats():
+        summaries = db.get_entry_summaries(limit=len(entries) + 1)
+        db.load_projections(summaries)
+        return compute_stats(summaries)
+    timed(results, "statistics", stats, args.repeat)
+
+    export_entries = entries[: args.export_entries] if args.export_entries else entries
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (ext, _filter, writer) in EXPORT_FORMATS.items():
+            out = os.path.join(tmp, "export" + ext)
+            timed(results, f"export[{name}]", lambda: writer(export_entries, out, db.inline_images), args.repeat)
+    db.close()
+    return results
+
+
+def run_crypto(args) -> dict:
+    """Compare the storage formats `EncryptionManager` can write.
+
+    For each cipher, times bulk decryption of entry-sized values (the
+    entry list load) and encryption/decryption throughput of
+    incompressible attachment chunks.
+    """
+    rng = random.Random(args.seed)
+    bodies = [make_content(rng, args.html_kb) for _ in range(min(args.crypto_values, 200))]
+    values = [bodies[i % len(bodies)] for i in range(args.crypto_values)]
+    chunk = rng.randbytes(1024 * 1024)
+    salt = EncryptionManager.generate_salt()
+    results = {}
+    for cipher in ("fernet", "aes-gcm", "chacha20-poly1305"):
+        enc = EncryptionManager(PASSWORD, salt, cipher=cipher)
+        tokens = [enc.encrypt_text(v) for v in values]
+        res = {"stored_bytes": sum(map(len, tokens))}
+        timed(res, "decrypt_many", lambda: enc.decrypt_many_text(tokens), args.repeat)
+        sealed = timed(res, "encrypt_chunks", lambda: [enc.encrypt_data(chunk) for _ in range(args.crypto_mb)], args.repeat)
+        timed(res, "decrypt_chunks", lambda: [enc.decrypt_data(t) for t in sealed], args.repeat)
+        for name in ("encrypt_chunks", "decrypt_chunks"):
+            res[name]["mb_per_s"] = round(args.crypto_mb / (res[name]["min_ms"] / 1000), 1)
+        enc.shutdown()
+        results[cipher] = res
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", type=int, default=500, help="number of entries to generate")
+    parser.add_argument("--html-kb", type=int, default=4, help="approximate text HTML size per entry")
+    parser.add_argument("--images-every", type=int, default=10,
+                        help="embed an inline image in every Nth entry (0 disables)")
+    parser.add_argument("--image-size", type=int, default=256, help="inline image width/height in pixels")
+    parser.add_argument("--attachments-every", type=int, default=20,
+                        help="attach a file to every Nth entry (0 disables)")
+    parser.add_argument("--attachment-kb", type=int, default=512, help="size of each attachment")
+    parser.add_argument("--export-entries", type=int, default=100,
+                        help="entries included in each export (0 exports all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement")
+    parser.add_argument("--crypto-values", type=int, default=2000,
+                        help="entry bodies decrypted per cipher in the format comparison")
+    parser.add_argument("--crypto-mb", type=int, default=16,
+                        help="MiB of attachment chunks encrypted per cipher in the format comparison")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the generated journal")
+    parser.add_argument("--db", help="journal file to use; generated if it does not exist")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    app = QGuiApplication.instance() or QGuiApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "myjourney.db")
+        generation_ms = None
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            generate(path, args)
+            generation_ms = round((time.perf_counter() - start) * 1000, 3)
+        report = {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parameters": {k: v for k, v in vars(args).items() if k not in ("db", "output")},
+            "db_bytes": os.path.getsize(path),
+            "generation_ms": generation_ms,
+            "results": run(path, args),
+            "crypto": run_crypto(args),
+        }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -2,118 +2,408 @@
 import sqlite3
 import os
 import json
-from typing import Optional
+import threading
+import functools
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
 from encryption import EncryptionManager
-from entry import Entry
-from datetime import date
+from entry import Entry, TRACKED_FIELDS
+from search_index import SearchIndex
+from plain_text import PROJECTION_VERSION, make_projection
+from migrations import TRACKED_TABLES, migrate, schema_version
+from inline_images import extract_images, image_id, image_refs, inline_refs
+from datetime import date, datetime
 
 DB_FILE = "myjourney.db"
+# Attachments are encrypted and stored in pieces of this many bytes so
+# they can be imported and exported with constant memory use.
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+# Per-connection tuning. WAL lets readers run alongside a write
+# transaction; synchronous=NORMAL is durable across application crashes
+# in WAL mode and only fsyncs at checkpoints.
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 16 * 1024
+# Pages copied per step of `snapshot()`
+SNAPSHOT_PAGES = 1024
+# Entries completed per query by `load_entries_details()`; stays below
+# SQLite's default limit on bound parameters
+DETAILS_BATCH_ROWS = 500
+# Re-encryption works through this many rows, or this many bytes of
+# ciphertext, per transaction
+REENCRYPT_BATCH_ROWS = 200
+REENCRYPT_BATCH_BYTES = 8 * 1024 * 1024
+# Tables holding encrypted values, in re-encryption order:
+# (table, key column, encrypted columns)
+ENCRYPTED_TABLES = [
+    ("config", "id", ("totp_secret",)),
+    ("entries", "id", ("encrypted_title", "encrypted_content", "encrypted_tags", "encrypted_font_family",
+                       "encrypted_font_size", "encrypted_last_saved", "encrypted_projection")),
+    ("attachments", "id", ("encrypted_data",)),
+    ("attachment_chunks", "rowid", ("encrypted_data",)),
+    ("images", "rowid", ("encrypted_data",)),
+]
+# entries column holding each tracked `Entry` field
+ENTRY_COLUMNS = {
+    "date": "date",
+    "title": "encrypted_title",
+    "content": "encrypted_content",
+    "tags": "encrypted_tags",
+    "font_family": "encrypted_font_family",
+    "font_size": "encrypted_font_size",
+    "last_saved": "encrypted_last_saved",
+}
 
 
 """Database access layer for MyJournal.
 
 This module exposes a small `DatabaseManager` that wraps sqlite3 and
-handles storing encrypted entries, attachments, and the per-install
+handles storing encrypted entries, chunked attachments, and the per-install
 configuration (salt and TOTP secret). The manager expects to be
 connected with an `EncryptionManager` before use.
 """
 
+def _writes(method):
+    """Run a `DatabaseManager` method while holding its write lock.
+
+    The writer connection and its shared cursor are used both from the
+    GUI thread and from the background entry writer (write_queue.py).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class DatabaseManager:
-    def __init__(self):
-        """Create a manager instance; call `connect()` before use."""
+    def __init__(self, path: str = DB_FILE):
+        """Create a manager for the database file at ``path``.
+
+        Call `connect()` before use.
+        """
+        self.path = path
+        # writer connection; reads go through `reader()`
         self.conn: Optional[sqlite3.Connection] = None
         self.cur: Optional[sqlite3.Cursor] = None
         self.enc: Optional[EncryptionManager] = None
+        self.search_index: Optional[SearchIndex] = None
+        # key for the content addresses of stored images
+        self.image_key: Optional[bytes] = None
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        # serializes use of the writer connection across threads
+        self.write_lock = threading.RLock()
+
+    def _open_connection(self, readonly: bool = False) -> sqlite3.Connection:
+        """Open a connection to ``path`` with the app's pragmas applied."""
+        if readonly:
+            conn = sqlite3.connect(Path(self.path).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """Return the calling thread's read-only connection.
+
+        Each thread gets its own connection, opened on first use. In WAL
+        mode these see the last committed state and are never blocked
+        by a write in progress on the writer connection, so background
+        work (indexing, exports) and autosave do not wait on each other.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection(readonly=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def release_reader(self):
+        """Close the calling thread's read-only connection, if it has one.
+
+        Worker threads call this before they end; otherwise their
+        connection stays open until `close()`. The next `reader()` call
+        on the thread opens a new one.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._readers_lock:
+            try:
+                self._readers.remove(conn)
+            except ValueError:
+                # already closed by close()
+                return
+        conn.close()
 
     def connect(self, enc_manager: EncryptionManager):
         """Open (or create) the database file and set the encoder.
 
         ``enc_manager`` is used to encrypt/decrypt fields stored in the
-        database. The method opens `DB_FILE` in the current working
-        directory.
+        database. The method opens the manager's ``path`` (`DB_FILE` in
+        the current working directory by default) as the writer
+        connection. The connection may be opened on a worker thread (login
+        does this) and handed over to the GUI thread afterwards.
         """
-        self.conn = sqlite3.connect(DB_FILE)
+        self.conn = self._open_connection()
         self.cur = self.conn.cursor()
         self.enc = enc_manager
+        self.search_index = SearchIndex(enc_manager.derive_subkey("search-index"))
+        self.image_key = enc_manager.derive_subkey("image-id")
 
     def _ensure_connected(self):
         # Narrow types for static analysis using assertions
         assert self.conn is not None and self.cur is not None and self.enc is not None, (
             "DatabaseManager is not connected. Call connect() first.")
     def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
         if self.conn:
             self.conn.close()
+        if self.enc:
+            self.enc.shutdown()
         self.conn = None
         self.cur = None
         self.enc = None
+        self.search_index = None
+        self.image_key = None
+
+    def replace_with(self, path: str):
+        """Close the database and atomically replace its file with the database at ``path``.
+
+        Used to restore backups. Every background writer must have been
+        stopped first; the manager has to be connected again afterwards.
+        """
+        with self.write_lock:
+            self.close()
+            # closing the last connection checkpoints the log; a leftover
+            # one must not be replayed onto the new file
+            for suffix in ("-wal", "-shm"):
+                try:
+                    os.remove(str(self.path) + suffix)
+                except FileNotFoundError:
+                    pass
+            os.replace(path, self.path)
+
+    @_writes
+    def checkpoint(self):
+        """Copy the write-ahead log into the main database file.
+
+        Call before reading the database file directly (e.g. to back it
+        up) so it holds every committed change.
+        """
+        self._ensure_connected()
+        assert self.conn is not None
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def snapshot(self, path: str, progress=None):
+        """Write a consistent copy of the database to ``path``.
 
+        Uses SQLite's online backup API on a read-only connection, so
+        saves carry on meanwhile; if one lands mid-copy SQLite restarts
+        the copy rather than mixing old and new pages. ``progress(done,
+        total)`` is called with page counts after each step.
+        """
+        self._ensure_connected()
+        src = self._open_connection(readonly=True)
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst, pages=SNAPSHOT_PAGES,
+                       progress=None if progress is None else lambda status, remaining, total: progress(total - remaining, total))
+        finally:
+            dst.close()
+            src.close()
+
+    def export_changes(self, path: str, since: int) -> int:
+        """Copy every row changed after change ``since`` into a new database at ``path``.
+
+        ``path`` gets a ``changes`` table listing the changed rows (see
+        migrations.py) and one table per tracked table holding their
+        current versions; rows listed in ``changes`` but missing there
+        were deleted. Everything is read in one transaction, so the copy
+        is consistent. Returns the sequence number of the newest change
+        included, to pass as ``since`` next time.
+        """
+        self._ensure_connected()
+        out = sqlite3.connect(path, isolation_level=None, uri=True)
+        try:
+            out.execute("ATTACH DATABASE ? AS live", (Path(self.path).resolve().as_uri() + "?mode=ro",))
+            out.execute("BEGIN")
+            until = out.execute("SELECT IFNULL(MAX(seq), 0) FROM live.changes").fetchone()[0]
+            out.execute("CREATE TABLE changes AS SELECT tbl, row_key, seq FROM live.changes WHERE seq > ? AND seq <= ?",
+                        (since, until))
+            for table, (tbl, key, _) in TRACKED_TABLES.items():
+                out.execute(f"""CREATE TABLE {table} AS SELECT * FROM live.{table}
+                                WHERE {key} IN (SELECT row_key FROM changes WHERE tbl = ?)""", (tbl,))
+            out.execute("COMMIT")
+            # so the copy can be matched to databases of the same schema
+            out.execute(f"PRAGMA user_version = {out.execute('PRAGMA live.user_version').fetchone()[0]}")
+            out.execute("DETACH DATABASE live")
+        finally:
+            out.close()
+        return until
+
+    def last_backup(self) -> dict | None:
+        """Return the newest backup recorded by `record_backup()`, or None."""
+        self._ensure_connected()
+        row = self.reader().execute(
+            "SELECT id, parent, kind, seq, schema_version, created FROM backups ORDER BY rowid DESC LIMIT 1").fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "parent", "kind", "seq", "schema_version", "created"), row))
+
+    def schema_version(self) -> int:
+        """Return the schema version of the open database."""
+        self._ensure_connected()
+        return schema_version(self.reader())
+
+    @_writes
+    def record_backup(self, backup_id: str, parent: str | None, kind: int, seq: int):
+        """Remember a finished backup so the next incremental one builds on it.
+
+        Changes up to ``seq`` are in that backup and no later one needs
+        them, so they are dropped from the change log.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None
+        self.cur.execute("""INSERT INTO backups (id, parent, kind, seq, schema_version, created)
+                            VALUES (?, ?, ?, ?, ?, ?)""",
+                         (backup_id, parent, kind, seq, schema_version(self.conn), datetime.now().isoformat(timespec="seconds")))
+        # new changes are numbered after the highest left, so the one at
+        # ``seq`` stays (or a later change of its row already replaced it)
+        self.cur.execute("DELETE FROM changes WHERE seq < ?", (seq,))
+        self.conn.commit()
+
+    @_writes
     def init_db(self):
-        """Initialize the database schema if it doesn't exist."""
-        self._ensure_connected()
-        assert self.conn is not None and self.cur is not None and self.enc is not None
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS config (
-            id INTEGER PRIMARY KEY CHECK (id = 1),
-            salt BLOB,
-            totp_secret BLOB
-        )""")
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            encrypted_title BLOB,
-            encrypted_content BLOB,
-            encrypted_tags BLOB,
-            encrypted_font_family BLOB,
-            encrypted_font_size BLOB,
-            encrypted_last_saved BLOB
-        )""")
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS attachments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            entry_id INTEGER,
-            filename TEXT NOT NULL,
-            encrypted_data BLOB NOT NULL,
-            FOREIGN KEY(entry_id) REFERENCES entries(id) ON DELETE CASCADE
-        )""")
+        """Create or upgrade the schema, then tidy up unlinked attachments.
+
+        Schema changes live in migrations.py and only run when the
+        database's ``user_version`` is behind.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        migrate(self.conn)
+        # drop attachments imported for entries that were never saved
+        # or whose entry has since been deleted
+        self.cur.execute("DELETE FROM attachments WHERE entry_id IS NULL OR entry_id NOT IN (SELECT id FROM entries)")
+        self.cur.execute("DELETE FROM attachment_chunks WHERE attachment_id NOT IN (SELECT id FROM attachments)")
+        # and images no entry references any more. This only happens here:
+        # during a session the editor may still show an unlinked image
+        # (undo, paste into another entry) and save a reference to it again
+        self.cur.execute("DELETE FROM images WHERE id NOT IN (SELECT image_id FROM entry_images)")
         self.conn.commit()
+        # the password key only has to stay readable while a re-key runs
+        if self.enc.previous is not None and not (self.reencrypt_status() or {}).get("rekey"):
+            self.enc.previous = None
 
     def is_new(self) -> bool:
         """Check if the database is new (no config or entries)."""
-        if not os.path.exists(DB_FILE):
+        if not os.path.exists(self.path):
+            return True
+        conn = self.reader()
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='config'").fetchone() is None:
             return True
-        if self.conn is None or self.cur is None:
-            # Not connected, open a temp connection just to check
-            with sqlite3.connect(DB_FILE) as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='config'")
-                if cur.fetchone() is None:
-                    return True
-                cur.execute("SELECT 1 FROM config LIMIT 1")
-                return cur.fetchone() is None
-        self.cur.execute("SELECT 1 FROM config LIMIT 1")
-        return self.cur.fetchone() is None
+        return conn.execute("SELECT 1 FROM config LIMIT 1").fetchone() is None
 
+    def load_login_config(self) -> tuple[bytes, bytes, bytes | None] | None:
+        """Return the salt, encrypted TOTP secret and wrapped data key needed to log in.
+
+        Works before `connect()`, since the key cannot be derived without
+        the salt. The wrapped key is None for journals not converted to
+        key wrapping yet (see `upgrade_key()`). Returns None if the
+        config row is missing.
+        """
+        conn = self.reader()
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(config)")]
+        wrapped = "wrapped_key" if "wrapped_key" in cols else "NULL"
+        row = conn.execute(f"SELECT salt, totp_secret, {wrapped} FROM config WHERE id = 1").fetchone()
+        return (bytes(row[0]), row[1], row[2]) if row else None
+
+    @_writes
     def save_config(self, salt: bytes, totp_secret: str):
-        """Save the salt and TOTP secret to the config table."""
+        """Save the salt, TOTP secret and wrapped data key to the config table."""
         self._ensure_connected()
         assert self.conn is not None and self.cur is not None and self.enc is not None
         enc_secret = self.enc.encrypt_text(totp_secret)
-        self.cur.execute("INSERT OR REPLACE INTO config (id, salt, totp_secret) VALUES (1, ?, ?)",
-                         (salt, enc_secret))
+        self.cur.execute("""INSERT OR REPLACE INTO config (id, salt, totp_secret, storage_format, wrapped_key)
+                            VALUES (1, ?, ?, ?, ?)""", (salt, enc_secret, self.enc.cipher, self.enc.wrap_key()))
         self.conn.commit()
 
+    @_writes
+    def upgrade_key(self) -> EncryptionManager:
+        """Move a journal encrypted under the password key to a wrapped data key.
+
+        Stores a new random data key, wrapped by the password key, and
+        switches to it; existing values are re-encrypted under it in the
+        background by `reencrypt_batch()` and stay readable meanwhile.
+        The search index is keyed by the data key, so it is rebuilt too.
+        Returns the manager now in use (unchanged if the journal already
+        has a data key).
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        row = self.cur.execute("SELECT wrapped_key FROM config WHERE id = 1").fetchone()
+        if row is None or row[0] is not None:
+            return self.enc
+        enc = self.enc.with_new_key()
+        state = self._new_reencrypt_state(enc.cipher, rekey=True)
+        self.cur.execute("UPDATE config SET wrapped_key = ?, storage_format = NULL, reencrypt_state = ? WHERE id = 1",
+                         (enc.wrap_key(), json.dumps(state)))
+        self.cur.execute("DELETE FROM search_index")
+        self.cur.execute("UPDATE entries SET indexed = 0")
+        self.conn.commit()
+        self.enc = enc
+        self.search_index = SearchIndex(enc.derive_subkey("search-index"))
+        self.image_key = enc.derive_subkey("image-id")
+        return enc
+
+    def change_password(self, current: str, new: str):
+        """Protect the journal with a new master password.
+
+        Only the wrapped data key and the salt are rewritten; the
+        manager switches to the new password once they are committed.
+        Runs two slow key derivations, so call it off the GUI thread.
+        Raises ValueError if ``current`` is wrong and RuntimeError while
+        a re-key started by `upgrade_key()` is still running.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        state = self.reencrypt_status()
+        if self.enc.previous is not None or (state and state.get("rekey")):
+            raise RuntimeError("The journal's encryption is still being upgraded; try again once it has finished.")
+        salt = self.load_salt()
+        if salt is None or not self.enc.is_password(current, salt):
+            raise ValueError("The current password is incorrect.")
+        new_salt = EncryptionManager.generate_salt()
+        password_key, wrapped = self.enc.rewrap(new, new_salt)
+        with self.write_lock:
+            self.cur.execute("UPDATE config SET salt = ?, wrapped_key = ? WHERE id = 1", (new_salt, wrapped))
+            self.conn.commit()
+        self.enc.set_password_key(password_key)
+
     def load_salt(self) -> bytes | None:
         """Load the salt from the config table."""
         self._ensure_connected()
         assert self.conn is not None and self.cur is not None and self.enc is not None
-        self.cur.execute("SELECT salt FROM config WHERE id = 1")
-        row = self.cur.fetchone()
+        row = self.reader().execute("SELECT salt FROM config WHERE id = 1").fetchone()
         return row[0] if row else None
 
     def load_totp_secret(self) -> str | None:
         """Load and decrypt the TOTP secret from the config table."""
         self._ensure_connected()
         assert self.conn is not None and self.cur is not None and self.enc is not None
-        self.cur.execute("SELECT totp_secret FROM config WHERE id = 1")
-        row = self.cur.fetchone()
+        row = self.reader().execute("SELECT totp_secret FROM config WHERE id = 1").fetchone()
         if row:
             return self.enc.decrypt_text(row[0])
         return None
@@ -122,91 +412,616 @@ class DatabaseManager:
         """Retrieve and decrypt all journal entries from the database."""
         self._ensure_connected()
         assert self.conn is not None and self.cur is not None and self.enc is not None
-        # ensure new columns exist (safe migration)
-        self.cur.execute("PRAGMA table_info(entries)")
-        cols = [r[1] for r in self.cur.fetchall()]
-        if 'encrypted_font_family' not in cols:
-            try:
-                self.cur.execute("ALTER TABLE entries ADD COLUMN encrypted_font_family BLOB")
-            except Exception:
-                pass
-        if 'encrypted_font_size' not in cols:
-            try:
-                self.cur.execute("ALTER TABLE entries ADD COLUMN encrypted_font_size BLOB")
-            except Exception:
-                pass
-        if 'encrypted_last_saved' not in cols:
-            try:
-                self.cur.execute("ALTER TABLE entries ADD COLUMN encrypted_last_saved BLOB")
-            except Exception:
-                pass
-        self.conn.commit()
-        self.cur.execute("SELECT id, date, encrypted_title, encrypted_content, encrypted_tags, encrypted_font_family, encrypted_font_size, encrypted_last_saved FROM entries ORDER BY date DESC")
+        # the font/last-saved columns are added by init_db(); this only reads
+        conn = self.reader()
+        rows = conn.execute("SELECT id, date, encrypted_title, encrypted_content, encrypted_tags, encrypted_font_family, encrypted_font_size, encrypted_last_saved FROM entries ORDER BY date DESC").fetchall()
+        decrypted = self._decrypt_rows([row[2:] for row in rows], lenient=(3, 4, 5))
         entries = []
-        for row in self.cur.fetchall():
-            eid, edate, etitle, econtent, etags, efontfam, efontsize, elast = row
-            title = self.enc.decrypt_text(etitle) if etitle else ""
-            content = self.enc.decrypt_text(econtent) if econtent else ""
-            tags_json = self.enc.decrypt_text(etags) if etags else "[]"
-            tags = json.loads(tags_json)
-            entry = Entry(eid, edate, title, content, tags)
-            # per-entry font metadata
-            try:
-                entry.font_family = self.enc.decrypt_text(efontfam) if efontfam else None
-            except Exception:
-                entry.font_family = None
-            try:
-                fs = self.enc.decrypt_text(efontsize) if efontsize else None
-                entry.font_size = int(fs) if fs else None
-            except Exception:
-                entry.font_size = None
-            # last saved
-            try:
-                entry.last_saved = self.enc.decrypt_text(elast) if elast else None
-            except Exception:
-                entry.last_saved = None
-            # load attachments
-            self.cur.execute("SELECT filename, encrypted_data FROM attachments WHERE entry_id = ?", (eid,))
-            for fname, edata in self.cur.fetchall():
-                data = self.enc.decrypt_data(edata)
-                entry.attachments.append({"filename": fname, "data": data})
+        by_id = {}
+        for (eid, edate, *_), (title, *details) in zip(rows, decrypted):
+            entry = Entry(eid, edate, title or "")
+            self._apply_entry_details(entry, details)
+            entry.mark_clean()
             entries.append(entry)
+            by_id[eid] = entry
+        # load all attachment metadata in one pass instead of one query per entry
+        for aid, eid, fname, size in conn.execute("SELECT id, entry_id, filename, size FROM attachments ORDER BY entry_id, id"):
+            entry = by_id.get(eid)
+            if entry is not None:
+                entry.attachments.append({"id": aid, "filename": fname, "size": size})
         return entries
 
+    def get_entry_summaries(self, limit: int = 200, after: tuple[str, int] | None = None) -> list[Entry]:
+        """Return one page of lightweight entries (id, date and title only).
+
+        Entries are ordered newest first. Pass the ``(date, id)`` of the
+        last entry of the previous page as ``after`` to fetch the next
+        page; keyset paging keeps pages stable while new entries are
+        being saved. The returned entries have ``loaded`` set to False
+        and must go through `load_entry_details()` before their body,
+        tags or attachments are used.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        if after is None:
+            rows = self.reader().execute("SELECT id, date, encrypted_title FROM entries ORDER BY date DESC, id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            adate, aid = after
+            rows = self.reader().execute("""SELECT id, date, encrypted_title FROM entries
+                                            WHERE date < ? OR (date = ? AND id < ?)
+                                            ORDER BY date DESC, id DESC LIMIT ?""", (adate, adate, aid, limit)).fetchall()
+        titles = self.enc.decrypt_many_text([etitle for _, _, etitle in rows])
+        entries = []
+        for (eid, edate, _), title in zip(rows, titles):
+            entry = Entry(eid, edate, title or "")
+            entry.loaded = False
+            entry.mark_clean()
+            entries.append(entry)
+        return entries
+
+    def load_entry_details(self, entry: Entry):
+        """Fetch and decrypt the body, metadata and attachments of ``entry``.
+
+        Used to complete entries returned by `get_entry_summaries()`. The
+        entry is updated in place; entries that are already loaded or
+        were never saved are left untouched.
+        """
+        self.load_entries_details([entry])
+
+    def load_entries_details(self, entries: Iterable[Entry]):
+        """Like `load_entry_details()` for many entries at once.
+
+        Rows are fetched in batches of `DETAILS_BATCH_ROWS` and each batch
+        is decrypted with one bulk `EncryptionManager.decrypt_many_text()`
+        call per column, so exports and stats over a whole journal use
+        every core instead of decrypting entry by entry.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        pending = [e for e in entries if not e.loaded and e.id is not None]
+        conn = self.reader()
+        for start in range(0, len(pending), DETAILS_BATCH_ROWS):
+            batch = {e.id: e for e in pending[start:start + DETAILS_BATCH_ROWS]}
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(f"""SELECT id, encrypted_content, encrypted_tags, encrypted_font_family,
+                                           encrypted_font_size, encrypted_last_saved
+                                    FROM entries WHERE id IN ({marks})""", tuple(batch)).fetchall()
+            decrypted = self._decrypt_rows([row[1:] for row in rows], lenient=(2, 3, 4))
+            attachments: dict[int, list[dict]] = {eid: [] for eid in batch}
+            for aid, eid, fname, size in conn.execute(f"""SELECT id, entry_id, filename, size FROM attachments
+                                                          WHERE entry_id IN ({marks}) ORDER BY id""", tuple(batch)):
+                attachments[eid].append({"id": aid, "filename": fname, "size": size})
+            for (eid, *_), values in zip(rows, decrypted):
+                entry = batch[eid]
+                self._apply_entry_details(entry, values)
+                entry.attachments = attachments[eid]
+                entry.loaded = True
+                # title and date may hold unsaved edits; only the fetched fields are clean
+                entry.mark_clean(tuple(f for f in TRACKED_FIELDS if f not in ("date", "title")))
+
+    def get_attachment_info(self, entry_id: int) -> list[dict]:
+        """List an entry's attachments without reading or decrypting them.
+
+        Returns dicts with ``id``, ``filename`` and ``size`` (plaintext
+        bytes). ``size`` is None for attachments stored before sizes
+        were recorded.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        rows = self.reader().execute("SELECT id, filename, size FROM attachments WHERE entry_id = ? ORDER BY id", (entry_id,))
+        return [{"id": aid, "filename": fname, "size": size} for aid, fname, size in rows]
+
+    def get_attachment_data(self, attachment_id: int) -> bytes | None:
+        """Load and decrypt a single attachment by its ID.
+
+        This holds the whole attachment in memory; prefer
+        `iter_attachment_chunks()` or `export_attachment()` for large files.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        if self.reader().execute("SELECT 1 FROM attachments WHERE id = ?", (attachment_id,)).fetchone() is None:
+            return None
+        return b"".join(self.iter_attachment_chunks(attachment_id))
+
+    def iter_attachment_chunks(self, attachment_id: int) -> Iterator[bytes]:
+        """Yield the decrypted contents of an attachment piece by piece."""
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        row = self.reader().execute("SELECT chunked, encrypted_data FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+        if row is None:
+            return
+        chunked, edata = row
+        if not chunked:
+            yield self.enc.decrypt_data(edata)
+            return
+        # a dedicated cursor streams rows without disturbing other reads
+        chunks = self.reader().execute("SELECT encrypted_data FROM attachment_chunks WHERE attachment_id = ? ORDER BY seq", (attachment_id,))
+        for (echunk,) in chunks:
+            yield self.enc.decrypt_data(echunk)
+
+    def export_attachment(self, attachment_id: int, path: str):
+        """Decrypt an attachment straight into the file at ``path``."""
+        with open(path, "wb") as f:
+            for chunk in self.iter_attachment_chunks(attachment_id):
+                f.write(chunk)
+
+    @_writes
+    def import_attachment(self, path: str, filename: str | None = None) -> dict:
+        """Encrypt the file at ``path`` into the database chunk by chunk.
+
+        The attachment is stored unlinked; it becomes part of an entry when
+        that entry is saved with the returned dict in its ``attachments``.
+        Unlinked attachments are discarded by `init_db()`.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        filename = filename or os.path.basename(path)
+
+        def read_chunks():
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(ATTACHMENT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        try:
+            att = self._store_attachment(None, filename, read_chunks())
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return att
+
+    def _store_attachment(self, entry_id: int | None, filename: str, chunks: Iterable[bytes]) -> dict:
+        """Insert an attachment row and its encrypted chunks (no commit)."""
+        assert self.cur is not None and self.enc is not None
+        self.cur.execute("INSERT INTO attachments (entry_id, filename, size, chunked, encrypted_data) VALUES (?, ?, 0, 1, ?)",
+                         (entry_id, filename, b""))
+        att_id = self.cur.lastrowid
+        size = 0
+        for seq, chunk in enumerate(chunks):
+            self.cur.execute("INSERT INTO attachment_chunks (attachment_id, seq, encrypted_data) VALUES (?, ?, ?)",
+                             (att_id, seq, self.enc.encrypt_data(chunk)))
+            size += len(chunk)
+        self.cur.execute("UPDATE attachments SET size = ? WHERE id = ?", (size, att_id))
+        return {"id": att_id, "filename": filename, "size": size}
+
+    def _delete_attachments(self, where: str, params: tuple):
+        """Delete attachments matching ``where`` together with their chunks (no commit)."""
+        assert self.cur is not None
+        self.cur.execute(f"DELETE FROM attachment_chunks WHERE attachment_id IN (SELECT id FROM attachments WHERE {where})", params)
+        self.cur.execute(f"DELETE FROM attachments WHERE {where}", params)
+
+    def _decrypt_rows(self, rows: list, lenient: tuple[int, ...] = ()) -> list[tuple]:
+        """Decrypt every column of ``rows`` into text.
+
+        Each column is decrypted across all rows in one bulk
+        `EncryptionManager.decrypt_many_text()` call so large loads use
+        every core. Columns listed in ``lenient`` yield None for values
+        that fail to decrypt instead of raising.
+        """
+        assert self.enc is not None
+        if not rows:
+            return []
+        columns = [self.enc.decrypt_many_text(col, strict=i not in lenient) for i, col in enumerate(zip(*rows))]
+        return list(zip(*columns))
+
+    def _apply_entry_details(self, entry: Entry, values):
+        """Set the decrypted non-title fields of an entries row on ``entry``.
+
+        ``values`` holds content, tags JSON, font family, font size and
+        last saved in that order; missing values are None.
+        """
+        content, tags_json, font_family, font_size, last_saved = values
+        entry.content = content or ""
+        entry.tags = json.loads(tags_json) if tags_json else []
+        # per-entry font metadata
+        entry.font_family = font_family or None
+        try:
+            entry.font_size = int(font_size) if font_size else None
+        except ValueError:
+            entry.font_size = None
+        # last saved
+        entry.last_saved = last_saved or None
+
     def get_dates_with_entries(self) -> list[str]:
         """Get a list of all dates that have journal entries."""
         self._ensure_connected()
         assert self.conn is not None and self.cur is not None and self.enc is not None
-        self.cur.execute("SELECT DISTINCT date FROM entries ORDER BY date")
-        return [row[0] for row in self.cur.fetchall()]
+        return [row[0] for row in self.reader().execute("SELECT DISTINCT date FROM entries ORDER BY date")]
 
+    @_writes
     def save_entry(self, entry: Entry):
-        """Save or update a journal entry and its attachments."""
-        self._ensure_connected()
-        assert self.conn is not None and self.cur is not None and self.enc is not None
-        enc_title = self.enc.encrypt_text(entry.title) if entry.title else None
-        enc_content = self.enc.encrypt_text(entry.content) if entry.content else None
-        enc_tags = self.enc.encrypt_text(json.dumps(entry.tags))
-        enc_font_family = self.enc.encrypt_text(entry.font_family) if getattr(entry, 'font_family', None) else None
-        enc_font_size = self.enc.encrypt_text(str(entry.font_size)) if getattr(entry, 'font_size', None) else None
-        enc_last_saved = self.enc.encrypt_text(entry.last_saved) if getattr(entry, 'last_saved', None) else None
-        if entry.id is None:
-            self.cur.execute("""INSERT INTO entries (date, encrypted_title, encrypted_content, encrypted_tags, encrypted_font_family, encrypted_font_size, encrypted_last_saved)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)""", (entry.date, enc_title, enc_content, enc_tags, enc_font_family, enc_font_size, enc_last_saved))
+        """Save or update a journal entry and its attachments.
+
+        Existing entries only have their changed fields (see
+        `Entry.dirty_fields()`) encrypted and written.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        # never overwrite a stored body with the empty fields of a summary
+        if not entry.loaded:
+            self.load_entry_details(entry)
+        is_new = entry.id is None
+        fields = TRACKED_FIELDS if is_new else [f for f in TRACKED_FIELDS if f in entry.dirty_fields()]
+        cols = [ENTRY_COLUMNS[f] for f in fields]
+        # the body is encrypted below, once its images are taken out
+        values = [None if f == "content" else self._encode_entry_field(entry, f) for f in fields]
+        if "content" in fields:
+            # inline base64 images are stored once in the images table and
+            # the body keeps only references; ``entry.content`` is unchanged
+            stored_html, images = extract_images(entry.content, self.image_key)
+            if images:
+                self._store_images(images)
+            values[fields.index("content")] = self.enc.encrypt_text(stored_html) if stored_html else None
+        if "content" in fields or entry.plain_text is None:
+            # derive plain text once per body change for search, stats and export
+            projection = make_projection(entry.content)
+            cols.append("encrypted_projection")
+            values.append(self.enc.encrypt_text(json.dumps(projection)))
+            entry.plain_text, entry.word_count = projection["text"], projection["words"]
+        if is_new:
+            self.cur.execute(f"INSERT INTO entries ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", values)
             entry.id = self.cur.lastrowid
-        else:
-            self.cur.execute("""UPDATE entries SET date = ?, encrypted_title = ?, encrypted_content = ?, encrypted_tags = ?, encrypted_font_family = ?, encrypted_font_size = ?, encrypted_last_saved = ?
-                                WHERE id = ?""", (entry.date, enc_title, enc_content, enc_tags, enc_font_family, enc_font_size, enc_last_saved, entry.id))
-            self.cur.execute("DELETE FROM attachments WHERE entry_id = ?", (entry.id,))
-        for att in entry.attachments:
-            enc_data = self.enc.encrypt_data(att["data"])
-            self.cur.execute("INSERT INTO attachments (entry_id, filename, encrypted_data) VALUES (?, ?, ?)",
-                             (entry.id, att["filename"], enc_data))
+        elif cols:
+            assignments = ", ".join(f"{c} = ?" for c in cols)
+            self.cur.execute(f"UPDATE entries SET {assignments} WHERE id = ?", (*values, entry.id))
+        if is_new or {"title", "content", "tags"} & set(fields):
+            self._index_entry(entry.id, entry.title, entry.plain_text or "", entry.tags)
+        if "content" in fields:
+            self._link_images(entry.id, image_refs(stored_html))
+        self._save_attachment_changes(entry, is_new)
         self.conn.commit()
+        entry.mark_clean()
+        entry.mark_attachments_clean()
+
+    def _encode_entry_field(self, entry: Entry, field: str):
+        """Return the column value stored for one tracked entry field."""
+        assert self.enc is not None
+        value = getattr(entry, field)
+        if field == "date":
+            return value
+        if field == "tags":
+            return self.enc.encrypt_text(json.dumps(value))
+        if not value:
+            return None
+        return self.enc.encrypt_text(str(value))
 
+    def _save_attachment_changes(self, entry: Entry, is_new: bool):
+        """Persist only the attachments added to or removed from ``entry`` (no commit).
+
+        Stored attachments are never rewritten: removed ones are deleted by
+        id and added ones, already encrypted by `import_attachment()`, are
+        linked to the entry. Dicts carrying raw ``data`` instead of an id
+        are encrypted and stored here.
+        """
+        assert self.cur is not None
+        unstored = [att for att in entry.attachments if att.get("id") is None]
+        if not (is_new or entry.attachments_dirty or unstored):
+            return
+        if entry.removed_attachment_ids:
+            removed = entry.removed_attachment_ids
+            self._delete_attachments(f"id IN ({','.join('?' * len(removed))})", tuple(removed))
+        for att in unstored:
+            data = att.pop("data")
+            chunks = (data[i:i + ATTACHMENT_CHUNK_SIZE] for i in range(0, len(data), ATTACHMENT_CHUNK_SIZE))
+            att.update(self._store_attachment(entry.id, att["filename"], chunks))
+        pending = [att["id"] for att in entry.attachments]
+        if pending:
+            self.cur.execute(f"UPDATE attachments SET entry_id = ? WHERE entry_id IS NULL AND id IN ({','.join('?' * len(pending))})",
+                             (entry.id, *pending))
+
+    @_writes
     def delete_entry(self, entry_id: int):
         """Delete a journal entry and its attachments by ID."""
         self._ensure_connected()
         assert self.conn is not None and self.cur is not None and self.enc is not None
+        self._delete_attachments("entry_id = ?", (entry_id,))
+        self.cur.execute("DELETE FROM search_index WHERE entry_id = ?", (entry_id,))
+        self._link_images(entry_id, set())
         self.cur.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
-        self.conn.commit()
\ No newline at end of file
+        self.conn.commit()
+
+    def _store_images(self, images: dict[str, tuple[str, bytes]]) -> int:
+        """Encrypt and insert images not stored yet (no commit); returns how many were new."""
+        assert self.cur is not None and self.enc is not None
+        ids = list(images)
+        self.cur.execute(f"SELECT id FROM images WHERE id IN ({','.join('?' * len(ids))})", ids)
+        stored = {row[0] for row in self.cur.fetchall()}
+        added = 0
+        for img_id in ids:
+            if img_id not in stored:
+                mime, data = images[img_id]
+                self.cur.execute("INSERT INTO images (id, mime, encrypted_data) VALUES (?, ?, ?)",
+                                 (img_id, mime, self.enc.encrypt_data(data)))
+                added += 1
+        return added
+
+    def _link_images(self, entry_id: int, refs: set[str]):
+        """Make ``refs`` the images of an entry (no commit).
+
+        Images that lose their last reference are kept until the next
+        `init_db()`, so an edit that is undone can still find them.
+        """
+        assert self.cur is not None
+        self.cur.execute("SELECT image_id FROM entry_images WHERE entry_id = ?", (entry_id,))
+        linked = {row[0] for row in self.cur.fetchall()}
+        removed = linked - refs
+        if removed:
+            marks = ",".join("?" * len(removed))
+            self.cur.execute(f"DELETE FROM entry_images WHERE entry_id = ? AND image_id IN ({marks})", (entry_id, *removed))
+        self.cur.executemany("INSERT INTO entry_images (entry_id, image_id) VALUES (?, ?)",
+                             ((entry_id, r) for r in refs - linked))
+
+    @_writes
+    def store_image(self, data: bytes, mime: str) -> str:
+        """Store an image for an entry body and return its id.
+
+        Identical images share one row. The image stays unlinked until an
+        entry referencing it is saved; images no entry references are
+        discarded by the next `init_db()`.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        img_id = image_id(self.image_key, data)
+        self._store_images({img_id: (mime, data)})
+        self.conn.commit()
+        return img_id
+
+    def get_image(self, img_id: str) -> tuple[str, bytes] | None:
+        """Return the mime type and decrypted bytes of a stored image."""
+        self._ensure_connected()
+        assert self.enc is not None
+        row = self.reader().execute("SELECT mime, encrypted_data FROM images WHERE id = ?", (img_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], self.enc.decrypt_data(row[1])
+
+    def inline_images(self, html: str) -> str:
+        """Return ``html`` with stored images embedded as base64 data URIs."""
+        return inline_refs(html, self.get_image)
+
+    def _index_entry(self, entry_id: int, title: str, text: str, tags: list[str]):
+        """Replace the search postings of one entry (no commit)."""
+        assert self.cur is not None and self.search_index is not None
+        tokens = self.search_index.entry_tokens(title, text, tags)
+        self.cur.execute("DELETE FROM search_index WHERE entry_id = ?", (entry_id,))
+        self.cur.executemany("INSERT INTO search_index (token, entry_id) VALUES (?, ?)",
+                             ((t, entry_id) for t in tokens))
+        self.cur.execute("UPDATE entries SET indexed = 1 WHERE id = ?", (entry_id,))
+
+    @_writes
+    def index_pending_entries(self, limit: int = 50) -> int:
+        """Index up to ``limit`` entries not yet in the search index.
+
+        Returns how many entries were indexed; call repeatedly until it
+        returns 0 to finish indexing journals created before the index
+        existed.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        rows = self.reader().execute("SELECT id, encrypted_title, encrypted_tags, encrypted_projection FROM entries WHERE indexed = 0 LIMIT ?", (limit,)).fetchall()
+        decrypted = self._decrypt_rows([row[1:] for row in rows])
+        for (eid, *_), (title, tags_json, projection_json) in zip(rows, decrypted):
+            tags = json.loads(tags_json) if tags_json else []
+            projection = self._parse_projection(eid, projection_json)
+            self._index_entry(eid, title or "", projection["text"], tags)
+        self.conn.commit()
+        return len(rows)
+
+    def _parse_projection(self, entry_id: int, projection_json: str | None) -> dict:
+        """Parse a decrypted projection, recomputing it if missing or stale (no commit)."""
+        assert self.cur is not None and self.enc is not None
+        if projection_json:
+            projection = json.loads(projection_json)
+            if projection.get("v") == PROJECTION_VERSION:
+                return projection
+        row = self.reader().execute("SELECT encrypted_content FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        projection = make_projection(self.enc.decrypt_text(row[0]) if row and row[0] else "")
+        self.cur.execute("UPDATE entries SET encrypted_projection = ? WHERE id = ?",
+                         (self.enc.encrypt_text(json.dumps(projection)), entry_id))
+        return projection
+
+    @_writes
+    def load_projections(self, entries: list[Entry]):
+        """Fill ``plain_text``, ``word_count`` and ``tags`` without loading bodies.
+
+        Entries whose projection is already known are skipped; unsaved
+        entries, or entries with unsaved body edits, are projected from
+        their in-memory content.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        wanted = {}
+        for e in entries:
+            if e.id is None or (e.loaded and "content" in e.dirty_fields()):
+                projection = make_projection(e.content)
+                e.plain_text, e.word_count = projection["text"], projection["words"]
+            elif e.plain_text is None:
+                wanted[e.id] = e
+        ids = list(wanted)
+        # stay well below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows = self.reader().execute(f"SELECT id, encrypted_tags, encrypted_projection FROM entries WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall()
+            decrypted = self._decrypt_rows([row[1:] for row in rows])
+            for (eid, *_), (tags_json, projection_json) in zip(rows, decrypted):
+                e = wanted[eid]
+                projection = self._parse_projection(eid, projection_json)
+                e.plain_text, e.word_count = projection["text"], projection["words"]
+                if not e.loaded:
+                    e.tags = json.loads(tags_json) if tags_json else []
+                    e.mark_clean(("tags",))
+        self.conn.commit()
+
+    def search_entries(self, query: str) -> list[int] | None:
+        """Return the ids of entries containing every word of ``query``.
+
+        Words match on their beginning (``jour`` finds ``journal``).
+        Returns None when the query has no word long enough to look up.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.search_index is not None
+        tokens = self.search_index.query_tokens(query)
+        if not tokens:
+            return None
+        sql = " INTERSECT ".join(["SELECT entry_id FROM search_index WHERE token = ?"] * len(tokens))
+        return [row[0] for row in self.reader().execute(sql, tokens)]
+
+    def reencrypt_status(self) -> dict | None:
+        """Return the progress of converting stored values to the current format.
+
+        Returns None when every value is already in the format new values
+        are written in and every attachment is chunked; otherwise a dict with ``done`` and ``total`` row
+        counts (plus the checkpoint used by `reencrypt_batch()`).
+        """
+        self._ensure_connected()
+        assert self.enc is not None
+        row = self.reader().execute("SELECT storage_format, reencrypt_state FROM config WHERE id = 1").fetchone()
+        if row is None:
+            return None
+        storage_format, state = row
+        if state:
+            state = json.loads(state)
+            if state["target"] == self.enc.cipher:
+                return state
+            # restart for the new format; rows may still be under the old key
+            return self._new_reencrypt_state(self.enc.cipher, state.get("rekey", False))
+        if storage_format == self.enc.cipher and not self._has_unchunked_attachments():
+            return None
+        return self._new_reencrypt_state(self.enc.cipher)
+
+    def _has_unchunked_attachments(self) -> bool:
+        # attachments stored as one token before chunking existed
+        return self.reader().execute("SELECT 1 FROM attachments WHERE chunked = 0 LIMIT 1").fetchone() is not None
+
+    def _new_reencrypt_state(self, target: str, rekey: bool = False) -> dict:
+        conn = self.reader()
+        total = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table, _, _ in ENCRYPTED_TABLES)
+        # with rekey every value is rewritten, since old and new keys
+        # produce tokens of the same format
+        return {"target": target, "rekey": rekey, "table": 0, "after": None, "done": 0, "total": total}
+
+    @_writes
+    def reencrypt_batch(self) -> dict | None:
+        """Re-encrypt the next batch of stored values in the current format.
+
+        Each batch is one transaction that also stores the checkpoint in
+        ``config.reencrypt_state``, so an interrupted run resumes where it
+        stopped without skipping or repeating rows. Values already in the
+        current format are left alone (after `upgrade_key()` all values
+        are rewritten under the new key). On the way, inline images still
+        embedded in entry bodies are moved to the image store, and
+        attachments stored as one value are split into chunks with their
+        size recorded. Returns
+        the new progress (see `reencrypt_status()`), or None once the
+        whole database is converted.
+        """
+        self._ensure_connected()
+        assert self.conn is not None and self.cur is not None and self.enc is not None
+        state = self.reencrypt_status()
+        if state is None:
+            return None
+        budget = REENCRYPT_BATCH_BYTES
+        rows = 0
+        while state["table"] < len(ENCRYPTED_TABLES) and rows < REENCRYPT_BATCH_ROWS and budget > 0:
+            table, key, cols = ENCRYPTED_TABLES[state["table"]]
+            after = state["after"]
+            # sizes and format headers first; values are read only for the
+            # rows the byte budget admits
+            probe = ", ".join(f"length({c}), substr({c}, 1, 2)" for c in cols)
+            self.cur.execute(f"SELECT {key}, {probe} FROM {table} {'' if after is None else f'WHERE {key} > ?'} "
+                             f"ORDER BY {key} LIMIT ?", (() if after is None else (after,)) + (REENCRYPT_BATCH_ROWS - rows,))
+            fetched = self.cur.fetchall()
+            if not fetched:
+                state["table"] += 1
+                state["after"] = None
+                continue
+            # take rows up to the byte budget (at least one), noting which
+            # of their values to read and whether each needs rewriting;
+            # entry bodies may still hold inline images and attachments
+            # may still be one token, so those are read in any format
+            batch = []
+            for row in fetched:
+                if batch and budget <= 0:
+                    break
+                needed = []
+                for c, col in enumerate(cols):
+                    size, head = row[1 + 2 * c], row[2 + 2 * c]
+                    if not size:
+                        continue
+                    stale = bool(state.get("rekey")) or not self.enc.is_current(head)
+                    if stale or (table, col) in (("entries", "encrypted_content"), ("attachments", "encrypted_data")):
+                        needed.append((c, stale))
+                        budget -= size
+                batch.append((row[0], needed))
+            wanted = [k for k, needed in batch if needed]
+            values = {}
+            if wanted:
+                read = sorted({c for _, needed in batch for c, _ in needed})
+                self.cur.execute(f"SELECT {key}, {', '.join(cols[c] for c in read)} FROM {table} "
+                                 f"WHERE {key} IN ({', '.join('?' * len(wanted))})", wanted)
+                for row in self.cur.fetchall():
+                    values[row[0]] = dict(zip(read, row[1:]))
+            # decrypt all of them in one bulk call
+            tokens = [(k, c) for k, needed in batch for c, _ in needed]
+            plain = dict(zip(tokens, self.enc.decrypt_many([values[k][c] for k, c in tokens])))
+            for k, needed in batch:
+                updates = {}
+                if table == "entries" and (k, 1) in plain:
+                    # new image rows are visited later in this pass
+                    state["total"] += self._extract_legacy_images(k, plain[(k, 1)].decode("utf-8"), updates)
+                elif table == "attachments" and (k, 0) in plain:
+                    # the chunks replace the value; chunked attachments keep an empty token
+                    state["total"] += self._chunk_legacy_attachment(k, plain[(k, 0)])
+                    needed = []
+                for c, stale in needed:
+                    if stale and cols[c] not in updates:
+                        updates[cols[c]] = self.enc.encrypt_data(plain[(k, c)])
+                if updates:
+                    self.cur.execute(f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in updates)} WHERE {key} = ?",
+                                     (*updates.values(), k))
+                state["after"] = k
+                state["done"] += 1
+                rows += 1
+        # rows saved meanwhile are visited too; keep the count within the total
+        state["total"] = max(state["total"], state["done"])
+        finished = state["table"] >= len(ENCRYPTED_TABLES)
+        if finished:
+            self.cur.execute("UPDATE config SET storage_format = ?, reencrypt_state = NULL WHERE id = 1", (state["target"],))
+            if state.get("rekey"):
+                self.enc.previous = None
+        else:
+            self.cur.execute("UPDATE config SET reencrypt_state = ? WHERE id = 1", (json.dumps(state),))
+        self.conn.commit()
+        return None if finished else state
+
+    def _extract_legacy_images(self, entry_id: int, html: str, updates: dict) -> int:
+        """Move base64 images of a decrypted entry body to the image store (no commit).
+
+        Returns the number of image rows added.
+        """
+        assert self.enc is not None
+        if "data:" not in html:
+            return 0
+        stored_html, images = extract_images(html, self.image_key)
+        added = 0
+        if images:
+            added = self._store_images(images)
+            self._link_images(entry_id, image_refs(stored_html))
+            updates["encrypted_content"] = self.enc.encrypt_text(stored_html)
+        return added
+
+    def _chunk_legacy_attachment(self, attachment_id: int, data: bytes) -> int:
+        """Store a single-token attachment in chunks and record its size (no commit).
+
+        Returns the number of chunk rows added.
+        """
+        assert self.cur is not None and self.enc is not None
+        starts = range(0, len(data), ATTACHMENT_CHUNK_SIZE)
+        chunks = (data[i:i + ATTACHMENT_CHUNK_SIZE] for i in starts)
+        self.cur.executemany("INSERT INTO attachment_chunks (attachment_id, seq, encrypted_data) VALUES (?, ?, ?)",
+                             ((attachment_id, seq, self.enc.encrypt_data(chunk)) for seq, chunk in enumerate(chunks)))
+        self.cur.execute("UPDATE attachments SET chunked = 1, size = ?, encrypted_data = ? WHERE id = ?",
+                         (len(data), b"", attachment_id))
+        return len(starts)
@@ -0,0 +1,118 @@
+"""Parsed editor documents of recently viewed entries.
+
+Opening an entry with ``setHtml()`` parses its body and decodes every
+inline image again, which makes flipping between two long entries slow.
+`DocumentCache` keeps the `QTextDocument` of the last few entries that
+were left without unsaved edits, so the editor can swap one back in
+with ``setDocument()`` instead. Each document remembers the exact
+``content`` string it was built from and is only reused while the entry
+still holds that string.
+"""
+
+from collections import OrderedDict
+from PySide6.QtCore import QUrl
+from PySide6.QtGui import QTextDocument, QImage
+from entry import Entry
+
+DEFAULT_CACHE_SIZE = 8
+DEFAULT_CACHE_MB = 64
+
+
+def document_cost(doc: QTextDocument, source: str) -> int:
+    """Estimate the memory held by ``doc`` in bytes.
+
+    Counts the body text and the decoded images the document has cached
+    as resources; layout data is left out.
+    """
+    cost = len(source) * 2
+    seen = set()
+    block = doc.begin()
+    while block.isValid():
+        it = block.begin()
+        while not it.atEnd():
+            fmt = it.fragment().charFormat()
+            if fmt.isImageFormat():
+                name = fmt.toImageFormat().name()
+                if name not in seen:
+                    seen.add(name)
+                    res = doc.resource(QTextDocument.ResourceType.ImageResource, QUrl(name))
+                    if isinstance(res, QImage):
+                        cost += res.sizeInBytes()
+            it += 1
+        block = block.next()
+    return cost
+
+
+class DocumentCache:
+    """LRU of parsed entry documents, bounded by count and by total size.
+
+    Documents are moved out of the cache while they are shown, so the
+    editor owns exactly one document at a time. Evicted documents are
+    released with ``deleteLater()``.
+    """
+
+    def __init__(self, max_docs: int = DEFAULT_CACHE_SIZE, max_mb: int = DEFAULT_CACHE_MB):
+        # entry -> (document, content it was built from, estimated bytes)
+        self._docs: "OrderedDict[Entry, tuple[QTextDocument, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self.max_docs = max_docs
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def resize(self, max_docs: int, max_mb: int):
+        """Change the limits, evicting documents that no longer fit."""
+        self.max_docs = max_docs
+        self.max_bytes = max_mb * 1024 * 1024
+        self._trim()
+
+    def put(self, entry: Entry, doc: QTextDocument, source: str):
+        """Keep ``doc``, built from ``source``, as the parsed body of ``entry``."""
+        self.discard(entry)
+        if self.max_docs <= 0:
+            doc.deleteLater()
+            return
+        cost = document_cost(doc, source)
+        if cost > self.max_bytes:
+            doc.deleteLater()
+            return
+        self._docs[entry] = (doc, source, cost)
+        self._bytes += cost
+        self._trim()
+
+    def take(self, entry: Entry) -> QTextDocument | None:
+        """Remove and return the document of ``entry`` if it is still current.
+
+        A document built from other content than ``entry.content`` is
+        released instead.
+        """
+        item = self._docs.pop(entry, None)
+        if item is None:
+            return None
+        doc, source, cost = item
+        self._bytes -= cost
+        if entry.content is not source:
+            doc.deleteLater()
+            return None
+        return doc
+
+    def discard(self, entry: Entry):
+        """Release the cached document of ``entry``, if any."""
+        item = self._docs.pop(entry, None)
+        if item is not None:
+            self._bytes -= item[2]
+            item[0].deleteLater()
+
+    def clear(self):
+        """Release every cached document."""
+        for doc, _source, _cost in self._docs.values():
+            doc.deleteLater()
+        self._docs.clear()
+        self._bytes = 0
+
+    def _trim(self):
+        while self._docs and (len(self._docs) > self.max_docs or self._bytes > self.max_bytes):
+            _entry, (doc, _source, cost) = self._docs.popitem(last=False)
+            self._bytes -= cost
+            doc.deleteLater()
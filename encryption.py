@@ -2,12 +2,73 @@
 
 This module derives a Fernet-compatible key from a user password and
 provides simple helpers to encrypt/decrypt text and binary data.
+
+Journals encrypt their values under a random data key. The key derived
+from the password only wraps (encrypts) the data key, which is stored
+in the database, so changing the password rewraps one small value
+instead of re-encrypting the journal. Journals created before this
+encrypt directly under the password key until they are converted.
+
+New values are written as a binary envelope::
+
+    0x01 | cipher << 4 | compression | 12-byte nonce | ciphertext + tag
+
+encrypted with AES-256-GCM (default) or ChaCha20-Poly1305 under a
+subkey of the data key; the two header bytes are authenticated as
+associated data. Values that compress well (entry HTML in particular)
+are compressed first.
+
+Older formats stay readable: plain Fernet tokens (which always start
+with ``g``) and Fernet tokens of compressed bytes prefixed with a
+one-byte ``z``/``s`` marker.
 """
 
 import os
+import copy
 import base64
+import zlib
+import hashlib
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence
 import argon2
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+# Bulk calls with fewer tokens than this decrypt on the calling thread;
+# handing small batches to the pool costs more than it saves.
+PARALLEL_MIN_TOKENS = 64
+# First byte of the binary envelope
+ENVELOPE_V1 = 0x01
+# cipher ids (high nibble of the second envelope byte)
+CIPHERS = {"aes-gcm": 0, "chacha20-poly1305": 1}
+# compression ids (low nibble of the second envelope byte)
+COMPRESS_NONE, COMPRESS_ZLIB, COMPRESS_ZSTD = 0, 1, 2
+NONCE_SIZE = 12
+# Prefixes of legacy compressed Fernet values (never "g", the first byte of a Fernet token)
+ZLIB_MARKER = b"z"
+ZSTD_MARKER = b"s"
+# Associated data of a wrapped data key
+WRAPPED_KEY_AAD = b"myjournal/data-key"
+# Values shorter than this are encrypted as they are
+COMPRESS_MIN_SIZE = 256
+# Larger values are compressed only if this much of their start shrinks
+# noticeably, so already-compressed data (JPEG, PNG, zip) is not retried
+COMPRESS_SAMPLE_SIZE = 4096
+
+
+class CompressionUnavailable(InvalidToken):
+    """A value is compressed with a method this installation cannot read.
+
+    An `InvalidToken`, so callers that skip unreadable values skip it too.
+    """
+
 
 class EncryptionManager:
     """Manage symmetric encryption derived from a password.
@@ -17,14 +78,123 @@ class EncryptionManager:
     both text and raw bytes.
     """
 
-    def __init__(self, password: str, salt: bytes):
-        """Derive a key from ``password`` and ``salt`` and prepare Fernet.
+    def __init__(self, password: str, salt: bytes, workers: Optional[int] = None,
+                 compression: Optional[str] = "zlib", cipher: str = "aes-gcm",
+                 wrapped_key: Optional[bytes] = None):
+        """Derive a key from ``password`` and ``salt`` and prepare the ciphers.
 
         ``salt`` should be saved alongside the encrypted data so the key
-        can be reproduced when the user logs back in.
+        can be reproduced when the user logs back in. ``workers`` sets the
+        thread count used by `decrypt_many()` (default: one per CPU).
+        ``compression`` is ``"zlib"`` (default), ``"zstd"`` or None to
+        store new values uncompressed. zstd is opt-in because values
+        written with it can only be read where the optional
+        ``zstandard`` package is installed; zlib values read anywhere.
+        ``cipher`` picks the format of new values: ``"aes-gcm"``,
+        ``"chacha20-poly1305"`` or ``"fernet"`` (the legacy format);
+        all three are always readable.
+
+        ``wrapped_key`` is the journal's data key as returned by
+        `wrap_key()`; it is unwrapped with the password key and raises
+        `InvalidToken` if the password is wrong. Without it the password
+        key itself encrypts values (journals created before key wrapping).
+        With it, `previous` still reads values under the password key,
+        for journals whose conversion has not finished.
         """
-        self.key = self._derive_key(password, salt)
+        self._password_key = base64.urlsafe_b64decode(self._derive_key(password, salt))
+        #: manager for the key values were encrypted under before a
+        #: re-key; `_open()` falls back to it while a conversion runs
+        self.previous: Optional["EncryptionManager"] = None
+        if wrapped_key is None:
+            self._set_key(self._password_key)
+        else:
+            self._set_key(self._unwrap(self._password_key, wrapped_key))
+        if cipher != "fernet" and cipher not in CIPHERS:
+            raise ValueError(f"Unknown cipher: {cipher}")
+        self.cipher = cipher
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        if compression not in ("zstd", "zlib", None):
+            raise ValueError(f"Unknown compression: {compression}")
+        self.compression = compression
+        if wrapped_key is not None:
+            self.previous = self._with_key(self._password_key)
+
+    def _set_key(self, raw_key: bytes):
+        self.key = base64.urlsafe_b64encode(raw_key)
         self.fernet = Fernet(self.key)
+        aead_key = self.derive_subkey("aead")
+        self._aeads = {CIPHERS["aes-gcm"]: AESGCM(aead_key), CIPHERS["chacha20-poly1305"]: ChaCha20Poly1305(aead_key)}
+
+    def _with_key(self, raw_key: bytes) -> "EncryptionManager":
+        """Return a manager with this one's settings and password but ``raw_key`` as data key."""
+        other = copy.copy(self)
+        other._set_key(raw_key)
+        other.previous = None
+        other._pool = None
+        other._pool_lock = threading.Lock()
+        return other
+
+    def with_new_key(self, keep_previous: bool = True) -> "EncryptionManager":
+        """Return a manager for a new random data key under the same password.
+
+        With ``keep_previous`` the new manager can still read values
+        encrypted under this manager's key (see `previous`) until they
+        have been re-encrypted.
+        """
+        other = self._with_key(os.urandom(32))
+        if keep_previous:
+            other.previous = self
+        return other
+
+    def wrap_key(self, password_key: Optional[bytes] = None) -> bytes:
+        """Return the data key encrypted under the password key, for storage.
+
+        ``password_key`` wraps it under another password key (see
+        `rewrap()`) instead of this manager's.
+        """
+        nonce = os.urandom(NONCE_SIZE)
+        raw_key = base64.urlsafe_b64decode(self.key)
+        wrapping_key = self._wrapping_key(password_key or self._password_key)
+        return nonce + AESGCM(wrapping_key).encrypt(nonce, raw_key, WRAPPED_KEY_AAD)
+
+    def rewrap(self, password: str, salt: bytes) -> tuple[bytes, bytes]:
+        """Wrap the data key under a new password without switching to it.
+
+        Returns the new password key and the wrapped data key. The data
+        key itself does not change, so nothing stored needs re-encrypting.
+        The caller stores the wrapped key (and ``salt``) in place of the
+        old one and only then hands the password key to
+        `set_password_key()`. Runs the slow key derivation.
+        """
+        if self.previous is not None:
+            raise RuntimeError("Values under the previous key must be re-encrypted first")
+        password_key = base64.urlsafe_b64decode(self._derive_key(password, salt))
+        return password_key, self.wrap_key(password_key)
+
+    def set_password_key(self, password_key: bytes):
+        """Switch to a password key returned by `rewrap()`."""
+        self._password_key = password_key
+
+    @staticmethod
+    def _wrapping_key(password_key: bytes) -> bytes:
+        return hmac.new(password_key, b"myjournal/key-wrap", hashlib.sha256).digest()
+
+    @classmethod
+    def _unwrap(cls, password_key: bytes, wrapped_key: bytes) -> bytes:
+        try:
+            return AESGCM(cls._wrapping_key(password_key)).decrypt(
+                wrapped_key[:NONCE_SIZE], wrapped_key[NONCE_SIZE:], WRAPPED_KEY_AAD)
+        except (InvalidTag, ValueError):
+            raise InvalidToken from None
+
+    def is_password(self, password: str, salt: bytes) -> bool:
+        """Return True if ``password`` and ``salt`` give this manager's password key."""
+        candidate = base64.urlsafe_b64decode(self._derive_key(password, salt))
+        return hmac.compare_digest(candidate, self._password_key)
 
     @staticmethod
     def _derive_key(password: str, salt: bytes):
@@ -43,23 +213,158 @@ class EncryptionManager:
         )
         return base64.urlsafe_b64encode(raw_key)
 
+    def derive_subkey(self, purpose: str) -> bytes:
+        """Return a 32-byte secret for ``purpose`` derived from the key.
+
+        Subkeys let other features (such as the search index) use keyed
+        hashes without reusing the encryption key itself.
+        """
+        raw_key = base64.urlsafe_b64decode(self.key)
+        return hmac.new(raw_key, f"myjournal/{purpose}".encode(), hashlib.sha256).digest()
+
     @staticmethod
     def generate_salt() -> bytes:
         """Return a new 16-byte cryptographically secure salt."""
         return os.urandom(16)
 
+    def _compress(self, data: bytes) -> tuple[int, bytes]:
+        """Return ``(compression id, payload)`` for ``data``."""
+        if self.compression is None or len(data) < COMPRESS_MIN_SIZE:
+            return COMPRESS_NONE, data
+        if len(data) > COMPRESS_SAMPLE_SIZE:
+            sample = data[:COMPRESS_SAMPLE_SIZE]
+            if len(zlib.compress(sample, 1)) > len(sample) * 0.9:
+                return COMPRESS_NONE, data
+        if self.compression == "zstd":
+            method, packed = COMPRESS_ZSTD, zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            method, packed = COMPRESS_ZLIB, zlib.compress(data, 6)
+        if len(packed) >= len(data):
+            return COMPRESS_NONE, data
+        return method, packed
+
+    @staticmethod
+    def _decompress(method: int, payload: bytes) -> bytes:
+        if method == COMPRESS_NONE:
+            return payload
+        if method == COMPRESS_ZLIB:
+            return zlib.decompress(payload)
+        if method == COMPRESS_ZSTD:
+            if zstandard is None:
+                raise CompressionUnavailable("This value is zstd-compressed; install the zstandard package to read it")
+            return zstandard.ZstdDecompressor().decompress(payload)
+        raise InvalidToken
+
+    def _seal(self, data: bytes) -> bytes:
+        method, payload = self._compress(data)
+        if self.cipher == "fernet":
+            marker = {COMPRESS_NONE: b"", COMPRESS_ZLIB: ZLIB_MARKER, COMPRESS_ZSTD: ZSTD_MARKER}[method]
+            return marker + self.fernet.encrypt(payload)
+        header = bytes((ENVELOPE_V1, CIPHERS[self.cipher] << 4 | method))
+        nonce = os.urandom(NONCE_SIZE)
+        return header + nonce + self._aeads[CIPHERS[self.cipher]].encrypt(nonce, payload, header)
+
+    def _open(self, token: bytes) -> bytes:
+        """Decrypt a value in any supported format; raises `InvalidToken` on failure."""
+        try:
+            return self._open_own(token)
+        except CompressionUnavailable:
+            # decrypted fine; the previous key would only hide the reason
+            raise
+        except InvalidToken:
+            if self.previous is None:
+                raise
+            return self.previous._open(token)
+
+    def _open_own(self, token: bytes) -> bytes:
+        if not token:
+            raise InvalidToken
+        first = token[0]
+        if first == ENVELOPE_V1:
+            header = token[:2]
+            aead = self._aeads.get(token[1] >> 4)
+            if aead is None or len(token) < 2 + NONCE_SIZE:
+                raise InvalidToken
+            try:
+                payload = aead.decrypt(token[2:2 + NONCE_SIZE], token[2 + NONCE_SIZE:], header)
+            except InvalidTag:
+                raise InvalidToken from None
+            return self._decompress(token[1] & 0x0F, payload)
+        if first == ZLIB_MARKER[0]:
+            return self._decompress(COMPRESS_ZLIB, self.fernet.decrypt(token[1:]))
+        if first == ZSTD_MARKER[0]:
+            return self._decompress(COMPRESS_ZSTD, self.fernet.decrypt(token[1:]))
+        return self.fernet.decrypt(token)
+
+    def is_current(self, token: bytes) -> bool:
+        """Return True if ``token`` is already in the format new values get."""
+        if self.cipher == "fernet":
+            return token[:1] != bytes((ENVELOPE_V1,))
+        return len(token) > 1 and token[0] == ENVELOPE_V1 and token[1] >> 4 == CIPHERS[self.cipher]
+
+    def reencrypt(self, token: bytes) -> bytes:
+        """Rewrite ``token`` in the current format (compressing if worthwhile)."""
+        return self._seal(self._open(token))
+
     def encrypt_text(self, text: str) -> bytes:
         """Encrypt a UTF-8 text string and return the token bytes."""
-        return self.fernet.encrypt(text.encode("utf-8"))
+        return self._seal(text.encode("utf-8"))
 
     def decrypt_text(self, token: bytes) -> str:
         """Decrypt token bytes and return the decoded UTF-8 string."""
-        return self.fernet.decrypt(token).decode("utf-8")
+        return self._open(token).decode("utf-8")
 
     def encrypt_data(self, data: bytes) -> bytes:
         """Encrypt arbitrary bytes and return the token bytes."""
-        return self.fernet.encrypt(data)
+        return self._seal(data)
 
     def decrypt_data(self, token: bytes) -> bytes:
         """Decrypt token bytes and return the original bytes."""
-        return self.fernet.decrypt(token)
\ No newline at end of file
+        return self._open(token)
+
+    def _decrypt_slice(self, tokens: Sequence[Optional[bytes]], strict: bool) -> list[Optional[bytes]]:
+        out: list[Optional[bytes]] = []
+        for token in tokens:
+            if not token:
+                out.append(None)
+                continue
+            try:
+                out.append(self._open(token))
+            except InvalidToken:
+                if strict:
+                    raise
+                out.append(None)
+        return out
+
+    def decrypt_many(self, tokens: Sequence[Optional[bytes]], strict: bool = True) -> list[Optional[bytes]]:
+        """Decrypt a batch of tokens, spreading the work over a thread pool.
+
+        The ciphers run in native code without the GIL, so large batches
+        scale across cores. Empty or None tokens yield None. With
+        ``strict=False`` undecryptable tokens also yield None instead of
+        raising `InvalidToken`. Results keep the order of ``tokens``.
+        """
+        if self.workers <= 1 or len(tokens) < PARALLEL_MIN_TOKENS:
+            return self._decrypt_slice(tokens, strict)
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="decrypt")
+            pool = self._pool
+        # one contiguous slice per worker keeps per-task overhead negligible
+        step = -(-len(tokens) // self.workers)
+        slices = [tokens[i:i + step] for i in range(0, len(tokens), step)]
+        out: list[Optional[bytes]] = []
+        for part in pool.map(lambda s: self._decrypt_slice(s, strict), slices):
+            out.extend(part)
+        return out
+
+    def decrypt_many_text(self, tokens: Sequence[Optional[bytes]], strict: bool = True) -> list[Optional[str]]:
+        """Like `decrypt_many()` but decode each result as UTF-8."""
+        return [None if b is None else b.decode("utf-8") for b in self.decrypt_many(tokens, strict)]
+
+    def shutdown(self):
+        """Stop the bulk-decryption threads, if any were started."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
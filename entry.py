@@ -2,12 +2,17 @@
 
 Fields are plain Python types for easy serialization: ``date`` is a
 string in YYYY-MM-DD format, ``content`` contains HTML, ``tags`` is a
-list of short strings, and ``attachments`` holds dicts with filename
-and raw bytes.
+list of short strings, and ``attachments`` holds dicts describing stored
+attachments (id, filename and size); the file data itself stays in the
+database until it is requested.
 """
 
 from datetime import date
 
+# Fields stored as columns of the entries table; changes to these are
+# tracked so saves only rewrite what actually changed.
+TRACKED_FIELDS = ("date", "title", "content", "tags", "font_family", "font_size", "last_saved")
+
 
 class Entry:
     """A journal entry.
@@ -27,10 +32,91 @@ class Entry:
         self.title = title
         self.content = content  # HTML string
         self.tags = tags or []  # list of str
-        self.attachments = attachments or []  # list of dict {'filename': str, 'data': bytes}
-        self._undo_stack: list[str] = []  # For rich text undo support
+        self.attachments = attachments or []  # list of dict {'id': int, 'filename': str, 'size': int}
         # per-entry display metadata
         self.font_family: str | None = None
         self.font_size: int | None = None
         # last saved timestamp (ISO string)
-        self.last_saved: str | None = None
\ No newline at end of file
+        self.last_saved: str | None = None
+        # cached plain-text projection of ``content``; None until computed or loaded
+        self.plain_text: str | None = None
+        self.word_count: int | None = None
+        # False for summaries (id/date/title only) whose body, tags and
+        # attachments have not been fetched from the database yet
+        self.loaded: bool = True
+        # attachment changes not yet persisted; lets saves skip attachment I/O
+        self.attachments_dirty: bool = False
+        self.removed_attachment_ids: list[int] = []
+        # field values as last read from / written to the database
+        self._saved_values: dict = {}
+        # attachment ids queued for removal when this copy was made by `snapshot()`
+        self._snapshot_removed_ids: set[int] = set()
+
+    def _field_value(self, field: str):
+        value = getattr(self, field)
+        # copy lists so in-place edits are noticed too
+        return tuple(value) if isinstance(value, list) else value
+
+    def mark_clean(self, fields: tuple[str, ...] = TRACKED_FIELDS):
+        """Record the current values of ``fields`` as the persisted state."""
+        self._saved_values.update({f: self._field_value(f) for f in fields})
+
+    def dirty_fields(self) -> set[str]:
+        """Return the tracked fields that changed since the last `mark_clean()`.
+
+        Entries that were never persisted report every field.
+        """
+        if not self._saved_values:
+            return set(TRACKED_FIELDS)
+        return {f for f in TRACKED_FIELDS if self._saved_values.get(f) != self._field_value(f)}
+
+    def add_attachment(self, att: dict):
+        """Add an attachment dict and remember that it needs linking on save."""
+        self.attachments.append(att)
+        self.attachments_dirty = True
+
+    def remove_attachment(self, index: int) -> dict:
+        """Remove the attachment at ``index`` and queue its deletion on save."""
+        att = self.attachments.pop(index)
+        if att.get("id") is not None:
+            self.removed_attachment_ids.append(att["id"])
+        self.attachments_dirty = True
+        return att
+
+    def mark_attachments_clean(self):
+        """Forget pending attachment changes after they were persisted."""
+        self.attachments_dirty = False
+        self.removed_attachment_ids = []
+
+    def snapshot(self) -> "Entry":
+        """Return a detached copy of this entry for saving on another thread.
+
+        Attachment dicts are shared so ids assigned while saving show up
+        here too; everything else is copied.
+        """
+        copy = Entry(self.id, self.date, self.title, self.content, list(self.tags), list(self.attachments))
+        copy.font_family = self.font_family
+        copy.font_size = self.font_size
+        copy.last_saved = self.last_saved
+        copy.plain_text = self.plain_text
+        copy.word_count = self.word_count
+        copy.loaded = self.loaded
+        copy.attachments_dirty = self.attachments_dirty
+        copy.removed_attachment_ids = list(self.removed_attachment_ids)
+        copy._snapshot_removed_ids = set(self.removed_attachment_ids)
+        copy._saved_values = dict(self._saved_values)
+        return copy
+
+    def apply_saved(self, saved: "Entry"):
+        """Take over the persisted state of ``saved``, a saved `snapshot()`.
+
+        Edits made after the snapshot was taken stay dirty.
+        """
+        if self.id is None:
+            self.id = saved.id
+        self._saved_values = dict(saved._saved_values)
+        if self.content == saved.content:
+            self.plain_text, self.word_count = saved.plain_text, saved.word_count
+        self.removed_attachment_ids = [i for i in self.removed_attachment_ids if i not in saved._snapshot_removed_ids]
+        self.attachments_dirty = bool(self.removed_attachment_ids) or (
+            [a.get("id") for a in self.attachments] != [a.get("id") for a in saved.attachments])
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""Export journal entries to PDF, HTML, RTF and Markdown files.
+
+The writers take fully loaded `Entry` objects and a destination path
+and do no user interaction, so they can be driven from the main window
+as well as from headless tools such as ``benchmark.py``. The PDF, RTF
+and Markdown writers render through `QTextDocument` and need a
+`QGuiApplication` instance.
+
+Entry bodies reference stored images (see inline_images.py); pass
+``images``, a callable returning the HTML with those images embedded
+(normally `DatabaseManager.inline_images`), so exports are self-contained.
+"""
+
+from PySide6.QtGui import QTextDocument
+
+
+def _body(entry, images) -> str:
+    return images(entry.content) if images else entry.content
+
+
+def combined_html(entries, images=None) -> str:
+    """Join entries into one HTML body, one page per entry."""
+    parts = []
+    for i, entry in enumerate(entries):
+        if i > 0:
+            parts.append("<div style='page-break-before: always;'></div>")
+        parts.append(f"<h1>{entry.title}</h1>")
+        parts.append(f"<p><i>{entry.date}</i></p>")
+        parts.append(_body(entry, images))
+        parts.append("<hr/>")
+    return "".join(parts)
+
+
+def export_pdf(entries, path: str, images=None):
+    """Write ``entries`` to an A4 PDF at ``path``."""
+    from PySide6.QtGui import QPdfWriter, QPageSize
+    from PySide6.QtCore import QMarginsF
+
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
+    writer.setPageMargins(QMarginsF(15, 15, 15, 15))
+    doc = QTextDocument()
+    doc.setHtml(combined_html(entries, images))
+    doc.print_(writer)
+
+
+def export_html(entries, path: str, images=None):
+    """Write ``entries`` to a standalone HTML file at ``path``."""
+    html = ("<html><head><meta charset='utf-8'><title>Journal Export</title></head><body>"
+            + combined_html(entries, images) + "</body></html>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def export_rtf(entries, path: str, images=None):
+    """Write ``entries`` to an RTF file at ``path``."""
+    from PySide6.QtGui import QTextDocumentWriter
+
+    doc = QTextDocument()
+    doc.setHtml(combined_html(entries, images))
+    writer = QTextDocumentWriter(path, b"rtf")
+    writer.write(doc)
+
+
+def export_markdown(entries, path: str, images=None):
+    """Write ``entries`` to a Markdown file at ``path``."""
+    md_content = ""
+    for entry in entries:
+        md_content += f"# {entry.title}\n\n"
+        md_content += f"*{entry.date}*\n\n"
+        # Convert HTML to Markdown
+        doc = QTextDocument()
+        doc.setHtml(_body(entry, images))
+        md_content += doc.toMarkdown()
+        md_content += "\n\n---\n\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(md_content)
+
+
+# format name -> (file extension, file dialog filter, writer)
+EXPORT_FORMATS = {
+    "PDF": (".pdf", "PDF (*.pdf)", export_pdf),
+    "HTML": (".html", "HTML (*.html)", export_html),
+    "RTF": (".rtf", "RTF (*.rtf)", export_rtf),
+    "Markdown": (".md", "Markdown (*.md)", export_markdown),
+}
@@ -0,0 +1,78 @@
+"""Inline images of journal entries, stored outside the entry body.
+
+Entry bodies used to carry pictures as ``data:image/...;base64`` URIs,
+which made every save re-encrypt the image and every ``toHtml()`` copy
+it. Images now live once in the ``images`` table, keyed by a keyed hash
+of their bytes so identical pictures in different entries are stored
+once, and bodies reference them as ``journal-image:<id>``. The editor
+resolves those references through `QTextDocument` resources.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import re
+
+IMAGE_URL_SCHEME = "journal-image"
+
+_DATA_URI_RE = re.compile(r"""(src\s*=\s*["'])data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=\s]+)(["'])""", re.IGNORECASE)
+_REF_RE = re.compile(r"""src\s*=\s*["']%s:([0-9a-f]+)["']""" % IMAGE_URL_SCHEME, re.IGNORECASE)
+
+
+def image_id(key: bytes, data: bytes) -> str:
+    """Return the content address of ``data``.
+
+    The hash is keyed so the database does not reveal which well-known
+    pictures a journal contains.
+    """
+    return hmac.new(key, data, hashlib.sha256).hexdigest()[:32]
+
+
+def image_url(img_id: str) -> str:
+    """Return the ``src`` under which an entry body references an image."""
+    return f"{IMAGE_URL_SCHEME}:{img_id}"
+
+
+def extract_images(html: str, key: bytes) -> tuple[str, dict[str, tuple[str, bytes]]]:
+    """Replace inline base64 images in ``html`` with image references.
+
+    Returns the rewritten HTML and a dict mapping each image id to its
+    ``(mime type, bytes)``. URIs that are not valid base64 are left alone.
+    """
+    images = {}
+
+    def replace(m):
+        try:
+            data = base64.b64decode(m.group(3), validate=False)
+        except (binascii.Error, ValueError):
+            return m.group(0)
+        img_id = image_id(key, data)
+        images[img_id] = (m.group(2).lower(), data)
+        return f"{m.group(1)}{image_url(img_id)}{m.group(4)}"
+
+    if "data:" not in html:
+        return html, images
+    return _DATA_URI_RE.sub(replace, html), images
+
+
+def image_refs(html: str) -> set[str]:
+    """Return the ids of the stored images referenced by ``html``."""
+    return set(_REF_RE.findall(html))
+
+
+def inline_refs(html: str, load) -> str:
+    """Turn image references in ``html`` back into base64 data URIs.
+
+    ``load(img_id)`` returns ``(mime type, bytes)`` or None; references
+    it cannot resolve are left as they are. Used for exports, which must
+    be readable without the journal.
+    """
+    def replace(m):
+        image = load(m.group(1))
+        if image is None:
+            return m.group(0)
+        mime, data = image
+        return f'src="data:{mime};base64,{base64.b64encode(data).decode("ascii")}"'
+
+    return _REF_RE.sub(replace, html)
@@ -7,18 +7,50 @@ authentication the main window is shown.
 
 import sys
 import os
-import sqlite3
 from PySide6.QtWidgets import QApplication, QMessageBox
 from PySide6.QtCore import QSettings
 from PySide6.QtGui import QIcon
 import pyotp
 from encryption import EncryptionManager
-from database import DatabaseManager, DB_FILE
-from auth import SetupDialog, LoginDialog
-from main_window import MainWindow
+from database import DatabaseManager
+from auth import SetupDialog, LoginDialog, run_in_background
+from main_window import MainWindow, ENTRY_PAGE_SIZE
 from datetime import datetime, timezone
 
 
+def authenticate(password: str, code: str, salt: bytes, enc_secret: bytes, wrapped_key: bytes | None):
+    """Unlock the journal and fetch the first page of entries.
+
+    Runs on a worker thread: derives the key, checks the TOTP code and
+    opens the database. Journals without a wrapped data key are given
+    one here and converted in the background. Returns the encryption
+    manager and the first page of entry summaries.
+    """
+    try:
+        enc = EncryptionManager(password, salt, wrapped_key=wrapped_key)
+        totp_secret = enc.decrypt_text(enc_secret)
+    except Exception:
+        raise ValueError("Invalid password")
+
+    totp = pyotp.TOTP(totp_secret)
+    if not totp.verify(code):
+        raise ValueError("Invalid authenticator code")
+
+    db.connect(enc)
+    try:
+        db.init_db()  # ensure tables exist
+        if wrapped_key is None:
+            enc = db.upgrade_key()
+        return enc, db.get_entry_summaries(ENTRY_PAGE_SIZE)
+    except Exception:
+        # leave nothing open for the next attempt from the login dialog
+        db.close()
+        raise
+    finally:
+        # the worker thread is done with the database
+        db.release_reader()
+
+
 app = QApplication(sys.argv)
 app.setStyle("Fusion")
 icon_path = os.path.join(os.path.dirname(__file__), "assets", "icon.ico")
@@ -34,7 +66,8 @@ if db.is_new():
         sys.exit(0)
     password = setup.password
     salt = EncryptionManager.generate_salt()
-    enc = EncryptionManager(password, salt)
+    enc = run_in_background("Creating encryption key...", EncryptionManager, password, salt)
+    enc = enc.with_new_key(keep_previous=False)
     db.connect(enc)
     db.init_db()
     db.save_config(salt, setup.secret)
@@ -48,31 +81,17 @@ while attempts < 5:
         sys.exit(0)
     password = login.pw.text()
     code = login.totp.text()
-    # Load salt and encrypted totp secret from DB (use a temp connection)
-    temp_conn = sqlite3.connect(DB_FILE)
-    temp_cur = temp_conn.cursor()
-    temp_cur.execute("SELECT salt, totp_secret FROM config")
-    row = temp_cur.fetchone()
-    temp_conn.close()
+    # Load salt and encrypted totp secret (readable before the key is known)
+    row = db.load_login_config()
     if not row:
         QMessageBox.critical(None, "Error", "Database corrupted.")
         sys.exit(1)
-    salt, enc_secret = row
+    salt, enc_secret, wrapped_key = row
     try:
-        enc = EncryptionManager(password, bytes(salt))
-        try:
-            totp_secret = enc.decrypt_text(enc_secret)
-        except Exception:
-            raise ValueError("Invalid password")
-        
-        totp = pyotp.TOTP(totp_secret)
-        if not totp.verify(code):
-            raise ValueError("Invalid authenticator code")
-            
-        # Successful login: connect DB and show main window
-        db.connect(enc)
-        db.init_db()  # ensure tables exist
-        win = MainWindow(db)
+        enc, first_page = run_in_background("Unlocking journal...", authenticate, password, code, salt, enc_secret,
+                                            wrapped_key)
+        # Successful login: show main window with the prefetched entry list
+        win = MainWindow(db, first_page)
         win.show()
         # Apply saved theme
         s = QSettings("MyJourney", "App")
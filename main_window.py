@@ -2,46 +2,88 @@
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QSplitter, QCalendarWidget, QListWidget, QListWidgetItem, QTextEdit,
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog,
-    QMessageBox, QMenu, QToolBar, QFontComboBox, QSpinBox, QToolButton, QInputDialog
+    QMessageBox, QMenu, QToolBar, QFontComboBox, QSpinBox, QToolButton, QInputDialog, QProgressDialog
 )
-from PySide6.QtCore import Qt, QDate, QSettings, QUrl, QTimer, QEvent, QByteArray, QBuffer, QIODevice
+from PySide6.QtCore import Qt, QDate, QSettings, QUrl, QTimer, QEvent, QByteArray, QBuffer, QIODevice, Signal
 from PySide6.QtGui import (
     QTextCharFormat, QDesktopServices, QAction, QTextDocument, QColor, QFont,
     QKeySequence, QTextListFormat, QTextCursor, QTextImageFormat, QTextTableFormat,
     QTextBlockFormat, QTextFrameFormat, QShortcut, QPixmap, QPainter, QIcon, QImage,
-    QPalette
+    QPalette, QTextFormat
 )
 from entry import Entry
+from inline_images import IMAGE_URL_SCHEME, image_url
+from database import DETAILS_BATCH_ROWS
+from write_queue import EntryWriter
+from document_cache import DocumentCache, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_MB
+from reencrypt import ReencryptJob
 from settings_dialog import SettingsDialog
-import base64
 import os
 from datetime import datetime
+from collections import OrderedDict
 from typing import Optional, List, Dict, Any
 from PySide6.QtCore import QPoint
 
+# Number of entry summaries fetched per page while filling the entry list
+ENTRY_PAGE_SIZE = 200
+# Image attachments larger than this are listed without a thumbnail
+THUMBNAIL_MAX_BYTES = 20 * 1024 * 1024
+# Decoded inline images kept by the editor across entry switches
+IMAGE_CACHE_SIZE = 32
+# Idle time after an edit before links in the edited text are recolored
+LINK_RECOLOR_DELAY_MS = 100
+
 
 class ResizableTextEdit(QTextEdit):
     """QTextEdit subclass that supports drag-to-resize for images while preserving aspect ratio.
 
     Click on an image then drag horizontally to change width; height is adjusted to keep aspect ratio.
+    ``imageResized`` is emitted once when the drag ends.
     """
+    imageResized = Signal(int, int)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # callable returning (mime, bytes) for a stored image id; set by MainWindow
+        self.image_source = None
+        # recently decoded stored images, so reloading a body skips decryption
+        self._image_cache: "OrderedDict[str, QImage]" = OrderedDict()
         self._resizing = False
         self._resize_cursor = None
+        self._resize_format = None
+        self._resize_edited = False
         self._start_pos = QPoint()
         self._orig_w = 0
         self._orig_h = 0
 
+    @staticmethod
+    def image_cursor(cursor: QTextCursor) -> Optional[QTextCursor]:
+        """Return a cursor selecting exactly the image next to ``cursor``, if any.
+
+        ``cursorForPosition`` lands on either side of an image depending on
+        which half was clicked, so both neighbouring characters are checked.
+        """
+        pos = cursor.position()
+        for start in (pos - 1, pos):
+            if start < 0:
+                continue
+            img = QTextCursor(cursor.document())
+            img.setPosition(start)
+            img.movePosition(QTextCursor.MoveOperation.NextCharacter, QTextCursor.MoveMode.KeepAnchor)
+            if img.position() == start + 1 and img.charFormat().isImageFormat():
+                return img
+        return None
+
     def mousePressEvent(self, event):
         try:
-            cursor = self.cursorForPosition(event.pos())
-            cf = cursor.charFormat()
-            if cf.isImageFormat():
+            cursor = self.image_cursor(self.cursorForPosition(event.pos()))
+            if cursor is not None:
+                imgfmt = cursor.charFormat().toImageFormat()
                 self._resizing = True
                 self._resize_cursor = cursor
+                self._resize_format = QTextImageFormat(imgfmt)
+                self._resize_edited = False
                 self._start_pos = event.pos()
-                imgfmt = cf.toImageFormat()
                 self._orig_w = int(imgfmt.width()) if imgfmt.width() else 0
                 self._orig_h = int(imgfmt.height()) if imgfmt.height() else 0
                 # if sizes not set, try to read actual image resource
@@ -77,44 +119,28 @@ class ResizableTextEdit(QTextEdit):
                     new_h = int(round(new_w * ratio))
                 else:
                     new_h = int(self._orig_h or new_w)
-                # apply format
+                fmt = self._resize_format
+                if int(fmt.width()) == new_w and int(fmt.height()) == new_h:
+                    return
+                fmt.setWidth(new_w)
+                fmt.setHeight(new_h)
+                # only the image's own format changes, so Qt relayouts just
+                # its block; the whole drag is merged into one undo step and
+                # listeners hear about it once, on release
                 cur = self._resize_cursor
-                imgfmt = cur.charFormat().toImageFormat()
-                newfmt = QTextImageFormat(imgfmt)
-                newfmt.setWidth(new_w)
-                newfmt.setHeight(new_h)
+                self.blockSignals(True)
                 try:
-                    cur.beginEditBlock()
-                    cur.select(QTextCursor.SelectionType.WordUnderCursor)
-                    cur.setCharFormat(newfmt)
-                finally:
+                    if self._resize_edited:
+                        cur.joinPreviousEditBlock()
+                    else:
+                        cur.beginEditBlock()
                     try:
+                        cur.setCharFormat(fmt)
+                    finally:
                         cur.endEditBlock()
-                    except Exception:
-                        pass
-                # also inject width/height attributes into the HTML so they persist
-                try:
-                    src = newfmt.name()
-                    html = self.toHtml()
-                    import re
-                    pattern = re.compile(r"(<img[^>]*src=[\'\"]%s[\'\"][^>]*)(>)" % re.escape(src))
-                    repl = r"\1 width=\"%d\" height=\"%d\"\2" % (new_w, new_h)
-                    new_html = pattern.sub(repl, html, count=1)
-                    if new_html != html:
-                        self.blockSignals(True)
-                        try:
-                            self.setHtml(new_html)
-                        finally:
-                            self.blockSignals(False)
-                except Exception:
-                    pass
-                # mark dirty on owning window
-                try:
-                    w = self.window()
-                    if hasattr(w, '_dirty'):
-                        setattr(w, '_dirty', True)
-                except Exception:
-                    pass
+                finally:
+                    self.blockSignals(False)
+                self._resize_edited = True
                 return
             except Exception:
                 pass
@@ -122,11 +148,44 @@ class ResizableTextEdit(QTextEdit):
 
     def mouseReleaseEvent(self, event):
         if getattr(self, '_resizing', False):
+            edited = self._resize_edited
+            fmt = self._resize_format
             self._resizing = False
             self._resize_cursor = None
+            self._resize_format = None
+            self._resize_edited = False
+            if edited:
+                # toHtml() writes the format's size as <img width/height>,
+                # so the next save persists it without touching the HTML
+                self.imageResized.emit(int(fmt.width()), int(fmt.height()))
             return
         super().mouseReleaseEvent(event)
 
+    def loadResource(self, type, name: QUrl):
+        """Resolve ``journal-image:`` references from the image store."""
+        if (type == QTextDocument.ResourceType.ImageResource and self.image_source is not None
+                and name.scheme() == IMAGE_URL_SCHEME):
+            img_id = name.path()
+            img = self._image_cache.get(img_id)
+            if img is None:
+                try:
+                    stored = self.image_source(img_id)
+                except Exception:
+                    stored = None
+                if stored is not None:
+                    img = QImage()
+                    img.loadFromData(stored[1])
+                    self._image_cache[img_id] = img
+                    if len(self._image_cache) > IMAGE_CACHE_SIZE:
+                        self._image_cache.popitem(last=False)
+            else:
+                self._image_cache.move_to_end(img_id)
+            if img is not None:
+                # the requesting document caches the result itself; it may
+                # not be the one on screen while an entry is being parsed
+                return img
+        return super().loadResource(type, name)
+
     def insertFromMimeData(self, source):
         """Override to handle pasting into code blocks better."""
         if source.hasText():
@@ -146,11 +205,22 @@ class MainWindow(QMainWindow):
     basic editing, attachment handling, search and export.
     """
 
-    def __init__(self, db):
+    def __init__(self, db, entries: Optional[List[Entry]] = None):
         super().__init__()
         self.db = db
-        # load current entries into memory
-        self.entries = db.get_all_entries()
+        # saves are encrypted and committed on a background thread
+        self.writer = EntryWriter(db, self)
+        self.writer.saved.connect(self._on_entry_saved)
+        self.writer.failed.connect(self._on_entry_save_failed)
+        # entries whose pending save was requested explicitly (report the outcome)
+        self._notify_saves: set = set()
+        # first page of entry summaries (possibly prefetched during login);
+        # bodies are fetched on demand
+        self.entries = entries if entries is not None else db.get_entry_summaries(ENTRY_PAGE_SIZE)
+        self._entries_complete = len(self.entries) < ENTRY_PAGE_SIZE
+        self._list_shows_all = True
+        # attachment id -> thumbnail icon, so list refreshes don't re-decrypt images
+        self._thumbnails: Dict[int, QIcon] = {}
         # ensure entries without font metadata reflect app default in UI
         self._apply_defaults_to_entries()
         self.current_entry = None
@@ -167,6 +237,25 @@ class MainWindow(QMainWindow):
         self.inactivity_timer.setInterval(timeout_minutes * 60 * 1000)  # minutes to milliseconds
         self.inactivity_timer.timeout.connect(self._logout_due_to_inactivity)
         self.inactivity_timer.start()
+        # fetch remaining summary pages once the window is responsive
+        self._last_summary = self._summary_cursor(self.entries)
+        if not self._entries_complete:
+            QTimer.singleShot(0, self._load_next_entry_page)
+        # index entries written before the search index existed
+        QTimer.singleShot(0, self._index_next_batch)
+        # convert values written in an older ciphertext format
+        self.reencrypt_job: Optional[ReencryptJob] = None
+        self.backup_job = None
+        try:
+            if self.db.reencrypt_status():
+                self.reencrypt_job = ReencryptJob(db, self)
+                self.reencrypt_job.progress.connect(self._on_reencrypt_progress)
+                self.reencrypt_job.finished.connect(lambda: self.statusBar().showMessage("Journal upgrade complete", 4000))
+                self.reencrypt_job.failed.connect(
+                    lambda error: self.statusBar().showMessage(f"Journal upgrade paused: {error}", 6000))
+                self.reencrypt_job.start()
+        except Exception:
+            self.reencrypt_job = None
 
     def _build_ui(self):
         """Initialize and arrange all UI components."""
@@ -190,6 +279,9 @@ class MainWindow(QMainWindow):
         file_menu.addAction("Delete Entry", self.delete_entry)
         file_menu.addSeparator()
         file_menu.addAction("Backup Database", self.backup_db)
+        file_menu.addAction("Incremental Backup", lambda: self.backup_db(incremental=True))
+        file_menu.addAction("Restore Backup...", self.restore_backup)
+        file_menu.addAction("Change Password...", self.change_password)
         
         edit_menu = menu.addMenu("Edit")
         edit_menu.addAction("Save Entry", lambda: self.save_current_entry(show_message=True), "Ctrl+S")
@@ -321,9 +413,9 @@ class MainWindow(QMainWindow):
         toolbar.addWidget(apply_btn)
         
         undo_btn = QToolButton()
-        undo_btn.setToolTip("Undo last apply")
+        undo_btn.setToolTip("Undo (Ctrl+Z)")
         undo_btn.setIcon(_get_icon("undo", "<"))
-        undo_btn.clicked.connect(self._undo_apply)
+        undo_btn.clicked.connect(self._undo)
         undo_btn.setEnabled(False)
         self._undo_btn = undo_btn
         toolbar.addWidget(undo_btn)
@@ -373,12 +465,32 @@ class MainWindow(QMainWindow):
         right_layout.addLayout(title_l)
         
         self.editor = ResizableTextEdit()
+        self.editor.image_source = self.db.get_image
         self.editor.setPlaceholderText("Write your journal entry here...")
         self.editor.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.editor.customContextMenuRequested.connect(self._editor_context_menu)
+        # entries are shown in documents of their own, so recently viewed
+        # ones can be swapped back in without parsing them again
+        s = QSettings("MyJourney", "App")
+        self._doc_cache = DocumentCache(int(s.value("document_cache_size", DEFAULT_CACHE_SIZE)),  # type: ignore
+                                        int(s.value("document_cache_mb", DEFAULT_CACHE_MB)))  # type: ignore
+        self.editor.setDocument(self._new_document())
         self.editor.textChanged.connect(self._on_editor_text_changed)
+        self.editor.imageResized.connect(self._on_image_resized)
         self.editor.cursorPositionChanged.connect(self._update_toolbar_from_cursor)
         right_layout.addWidget(self.editor, stretch=3)
+        # links in edited text are recolored once typing pauses, and only
+        # in the changed range (see _queue_link_recolor)
+        self._recolor_span: Optional[List[int]] = None
+        self._recoloring = False
+        # True until the document on screen is edited; recoloring its links
+        # before then is part of loading it, not an edit to undo
+        self._just_loaded = True
+        self._recolor_timer = QTimer(self)
+        self._recolor_timer.setSingleShot(True)
+        self._recolor_timer.setInterval(LINK_RECOLOR_DELAY_MS)
+        self._recolor_timer.timeout.connect(self._recolor_pending_links)
+        self._attach_document(self.editor.document())
         
         btn_l = QHBoxLayout()
         self.insert_img_btn = QPushButton("Insert Image Inline")
@@ -436,7 +548,7 @@ class MainWindow(QMainWindow):
         QShortcut(QKeySequence("Ctrl+I"), self).activated.connect(self._toggle_italic)
         QShortcut(QKeySequence("Ctrl+U"), self).activated.connect(self._toggle_underline)
         QShortcut(QKeySequence("Ctrl+Shift+S"), self).activated.connect(self._toggle_strike)
-        QShortcut(QKeySequence("Ctrl+Z"), self).activated.connect(self._undo_apply)
+        QShortcut(QKeySequence("Ctrl+Z"), self).activated.connect(self._undo)
         QShortcut(QKeySequence("Ctrl+]"), self).activated.connect(lambda: self._change_selection_font_size(1))
         QShortcut(QKeySequence("Ctrl+["), self).activated.connect(lambda: self._change_selection_font_size(-1))
         QShortcut(QKeySequence("Ctrl+S"), self).activated.connect(lambda: self.save_current_entry(show_message=True))
@@ -580,20 +692,58 @@ class MainWindow(QMainWindow):
         }}
         """
         self.editor.document().setDefaultStyleSheet(css)
-        QTimer.singleShot(0, self._recolor_all_links)
+        # parked documents still carry the old link style
+        self._doc_cache.clear()
+        self._queue_link_recolor()
+
+    def _on_contents_change(self, position: int, removed: int, added: int):
+        """Remember the range an edit touched so its links get recolored."""
+        if not self._recoloring:
+            self._just_loaded = False
+            self._queue_link_recolor(position, position + added)
+
+    def _queue_link_recolor(self, start: int = 0, end: Optional[int] = None):
+        """Recolor links between ``start`` and ``end`` (default: the whole document) once edits pause.
+
+        Ranges queued before the pass are merged, so a burst of
+        keystrokes costs one pass over the text they touched.
+        """
+        if end is None:
+            end = self.editor.document().characterCount()
+        if self._recolor_span is None:
+            self._recolor_span = [start, end]
+        else:
+            self._recolor_span[0] = min(self._recolor_span[0], start)
+            self._recolor_span[1] = max(self._recolor_span[1], end)
+        self._recolor_timer.start()
+
+    def _recolor_pending_links(self):
+        span, self._recolor_span = self._recolor_span, None
+        if span is not None:
+            self._recolor_links(*span)
 
     def _recolor_all_links(self):
-        """Iterate through the document and force all links to use the theme color."""
+        """Force every link in the document to use the theme color now."""
+        self._recolor_span = None
+        self._recolor_timer.stop()
+        self._recolor_links(0, self.editor.document().characterCount())
+
+    def _recolor_links(self, start: int, end: int):
+        """Force links in the blocks between ``start`` and ``end`` to use the theme color."""
         if not hasattr(self, 'cal_header_bg'):
             return
-        color = self.cal_header_bg
         doc = self.editor.document()
-        target = QColor(color)
+        target = QColor(self.cal_header_bg)
+        recolor = QTextCharFormat()
+        recolor.setForeground(target)
+        block = doc.findBlock(max(0, start))
+        last = doc.findBlock(max(0, min(end, doc.characterCount() - 1)))
+        fresh = self._just_loaded
+        modified = doc.isModified()
+        cursor = None
+        self._recoloring = True
         self.editor.blockSignals(True)
-        cursor = QTextCursor(doc)
-        cursor.beginEditBlock()
         try:
-            block = doc.begin()
             while block.isValid():
                 it = block.begin()
                 while not it.atEnd():
@@ -601,18 +751,28 @@ class MainWindow(QMainWindow):
                     if fragment.isValid():
                         fmt = fragment.charFormat()
                         if fmt.isAnchor() and fmt.foreground().color() != target:
-                            new_fmt = QTextCharFormat(fmt)
-                            new_fmt.setForeground(target)
-                            # Create a cursor and select the fragment to apply the format
-                            frag_cursor = QTextCursor(doc)
-                            frag_cursor.setPosition(fragment.position())
-                            frag_cursor.movePosition(QTextCursor.MoveOperation.NextCharacter, QTextCursor.MoveMode.KeepAnchor, fragment.length())
-                            frag_cursor.setCharFormat(new_fmt)
+                            if cursor is None:
+                                # ride along with the edit that brought the
+                                # link in, so undo does not stop on a recolor
+                                cursor = QTextCursor(doc)
+                                cursor.joinPreviousEditBlock()
+                            cursor.setPosition(fragment.position())
+                            cursor.setPosition(fragment.position() + fragment.length(), QTextCursor.MoveMode.KeepAnchor)
+                            cursor.mergeCharFormat(recolor)
                     it += 1
+                if block == last:
+                    break
                 block = block.next()
         finally:
-            cursor.endEditBlock()
+            if cursor is not None:
+                cursor.endEditBlock()
+                if fresh:
+                    # recoloring a just-loaded entry is not an edit to undo
+                    doc.clearUndoRedoStacks()
+                # nor one to save: links are recolored on every load
+                doc.setModified(modified)
             self.editor.blockSignals(False)
+            self._recoloring = False
 
     def _autosave(self):
         """Automatically save the current entry if it has been modified."""
@@ -630,7 +790,7 @@ class MainWindow(QMainWindow):
         except Exception:
             # on any unexpected error reading the title, skip autosave to avoid data loss
             return
-        # perform silent save
+        # perform silent save (written in the background)
         self._saving = True
         try:
             self.save_current_entry(show_message=False)
@@ -789,13 +949,13 @@ class MainWindow(QMainWindow):
             self.font_combo.blockSignals(False)
             self.font_size.blockSignals(False)
 
-    def _apply_defaults_to_entries(self):
+    def _apply_defaults_to_entries(self, entries: Optional[List] = None):
         """Ensure entries without explicit font metadata will appear using app defaults."""
         try:
             s = QSettings("MyJourney", "App")
             df = s.value("default_font", "")
             df_size = int(s.value("default_font_size", 12))  # type: ignore
-            for e in self.entries:
+            for e in (self.entries if entries is None else entries):
                 if not getattr(e, 'font_family', None):
                     e.font_family = df if df else None
                 if not getattr(e, 'font_size', None):
@@ -803,6 +963,60 @@ class MainWindow(QMainWindow):
         except Exception:
             pass
 
+    @staticmethod
+    def _summary_cursor(entries: List) -> Optional[tuple]:
+        """Return the (date, id) paging cursor after the last stored entry."""
+        for e in reversed(entries):
+            if e.id is not None:
+                return (e.date, e.id)
+        return None
+
+    def _load_next_entry_page(self):
+        """Append the next page of entry summaries to the in-memory list."""
+        if self._entries_complete:
+            return
+        try:
+            page = self.db.get_entry_summaries(ENTRY_PAGE_SIZE, after=self._last_summary)
+        except Exception:
+            self._entries_complete = True
+            return
+        if len(page) < ENTRY_PAGE_SIZE:
+            self._entries_complete = True
+        if page:
+            self._last_summary = self._summary_cursor(page)
+            self._apply_defaults_to_entries(page)
+            self.entries.extend(page)
+            # pages arrive newest first, so they can be appended to an unfiltered list
+            if self._list_shows_all:
+                self._append_entry_items(page)
+        if not self._entries_complete:
+            QTimer.singleShot(0, self._load_next_entry_page)
+
+    def _ensure_entry_loaded(self, entry: Entry):
+        """Fetch the body and attachments of a summary entry if needed."""
+        if entry.loaded:
+            return
+        self.db.load_entry_details(entry)
+        self._apply_defaults_to_entries([entry])
+
+    def _ensure_entries_loaded(self, entries: Optional[List] = None):
+        """Make every entry (default: all entries) fully loaded.
+
+        Used by features that need every body, such as search, stats and
+        exports. Remaining summary pages are fetched first.
+        """
+        if entries is None:
+            while not self._entries_complete:
+                self._load_next_entry_page()
+            entries = self.entries
+        pending = [e for e in entries if not e.loaded]
+        # one bulk query and decryption per batch; the UI repaints in between
+        for start in range(0, len(pending), DETAILS_BATCH_ROWS):
+            QApplication.processEvents()
+            batch = pending[start:start + DETAILS_BATCH_ROWS]
+            self.db.load_entries_details(batch)
+            self._apply_defaults_to_entries(batch)
+
     def _apply_entry_font_from_ui(self):
         """Apply the font settings from the entry-specific controls to the current entry."""
         # apply the font from the entry font controls to the editor and current_entry
@@ -811,19 +1025,10 @@ class MainWindow(QMainWindow):
         if self.current_entry:
             self.current_entry.font_family = fam
             self.current_entry.font_size = size
-        # push current html to undo stack
-        if self.current_entry is not None:
-            if not hasattr(self.current_entry, '_undo_stack'):
-                self.current_entry._undo_stack = []
-            try:
-                self.current_entry._undo_stack.append(self.editor.toHtml())
-            except Exception:
-                pass
-            self._undo_btn.setEnabled(True)
         new_html = self.format_whole_entry_html(self.editor.toHtml(), fam, size)
         self._suppress_dirty = True
         try:
-            self.editor.setHtml(new_html)
+            self._replace_editor_html(new_html)
         finally:
             self._suppress_dirty = False
         # mark dirty
@@ -948,23 +1153,28 @@ class MainWindow(QMainWindow):
         family = self.font_combo.currentFont().family()
         size = self.font_size.value()
         html = self.editor.toHtml()
-        # push to undo stack
-        if self.current_entry is not None:
-            if not hasattr(self.current_entry, '_undo_stack'):
-                self.current_entry._undo_stack = []
-            try:
-                self.current_entry._undo_stack.append(html)
-            except Exception:
-                pass
-            self._undo_btn.setEnabled(True)
         new_html = self.format_whole_entry_html(html, family, size)
         self._suppress_dirty = True
         try:
-            self.editor.setHtml(new_html)
+            self._replace_editor_html(new_html)
         finally:
             self._suppress_dirty = False
         self._dirty = True
 
+    def _replace_editor_html(self, html: str):
+        """Replace the editor contents as one step on the document's undo stack.
+
+        ``setHtml`` would clear the undo history, so the new content is
+        inserted over a whole-document selection instead.
+        """
+        cursor = QTextCursor(self.editor.document())
+        cursor.beginEditBlock()
+        try:
+            cursor.select(QTextCursor.SelectionType.Document)
+            cursor.insertHtml(html)
+        finally:
+            cursor.endEditBlock()
+
     @staticmethod
     def format_whole_entry_html(html: str, family: str, size: int) -> str:
         # Ensure we wrap the body content while preserving full HTML if present
@@ -989,13 +1199,7 @@ class MainWindow(QMainWindow):
         # detect image under cursor (for resize)
         try:
             cursor_at_pos = self.editor.cursorForPosition(pos)
-            cf = cursor_at_pos.charFormat()
-            is_image = False
-            try:
-                is_image = cf.isImageFormat()
-            except Exception:
-                is_image = False
-            if is_image:
+            if ResizableTextEdit.image_cursor(cursor_at_pos) is not None:
                 menu.addSeparator()
                 menu.addAction("Resize Image...", lambda: self._resize_image_at_cursor(cursor_at_pos))
         except Exception:
@@ -1127,10 +1331,10 @@ class MainWindow(QMainWindow):
     def _resize_image_at_cursor(self, cursor: QTextCursor):
         """Prompt for new width/height and apply to the image at `cursor`."""
         try:
-            cf = cursor.charFormat()
-            if not cf.isImageFormat():
+            cursor = ResizableTextEdit.image_cursor(cursor)
+            if cursor is None:
                 return
-            img_fmt = QTextImageFormat(cf.toImageFormat())
+            img_fmt = QTextImageFormat(cursor.charFormat().toImageFormat())
             # current sizes (may be 0 if not set)
             cur_w = int(img_fmt.width()) if img_fmt.width() else 0
             cur_h = int(img_fmt.height()) if img_fmt.height() else 0
@@ -1146,37 +1350,14 @@ class MainWindow(QMainWindow):
             if w > 0:
                 new_fmt.setWidth(w)
             else:
-                new_fmt.setWidth(0)
+                new_fmt.clearProperty(QTextFormat.Property.ImageWidth)
             if h > 0:
                 new_fmt.setHeight(h)
             else:
-                new_fmt.setHeight(0)
-            # set format at cursor (select the image then set)
-            try:
-                cursor.beginEditBlock()
-                cursor.select(QTextCursor.SelectionType.WordUnderCursor)
-                cursor.setCharFormat(new_fmt)
-            finally:
-                try:
-                    cursor.endEditBlock()
-                except Exception:
-                    pass
-            # inject width/height into HTML so it persists in saved content
-            try:
-                src = new_fmt.name()
-                html = self.editor.toHtml()
-                import re
-                pattern = re.compile(r"(<img[^>]*src=[\'\"]%s[\'\"][^>]*)(>)" % re.escape(src))
-                repl = r"\1 width=\"%d\" height=\"%d\"\2" % (w, h)
-                new_html = pattern.sub(repl, html, count=1)
-                if new_html != html:
-                    self.editor.blockSignals(True)
-                    try:
-                        self.editor.setHtml(new_html)
-                    finally:
-                        self.editor.blockSignals(False)
-            except Exception:
-                pass
+                new_fmt.clearProperty(QTextFormat.Property.ImageHeight)
+            # set the format on the image character only; the size is
+            # written out with the image the next time the entry is saved
+            cursor.setCharFormat(new_fmt)
             # reflect change in editor and mark dirty
             self._dirty = True
         except Exception:
@@ -1205,29 +1386,17 @@ class MainWindow(QMainWindow):
         if not getattr(self, '_suppress_dirty', False):
             self._dirty = True
 
-    def _undo_apply(self):
-        """Apply the last state from the undo stack."""
+    def _undo(self):
+        """Undo the last edit using the editor document's own undo stack."""
         if not self.current_entry:
             return
-        stack = getattr(self.current_entry, '_undo_stack', None)
-        if not stack:
+        self.editor.undo()
+
+    def _on_image_resized(self, width: int, height: int):
+        """Mark the entry dirty once a drag-resize ends."""
+        if getattr(self, '_initializing', False):
             return
-        try:
-            prev = stack.pop()
-            self._suppress_dirty = True
-            try:
-                self.editor.setHtml(prev)
-            finally:
-                self._suppress_dirty = False
-            # update entry content and mark dirty
-            try:
-                self.current_entry.content = prev
-            except Exception:
-                pass
-            self._dirty = True
-        finally:
-            if not getattr(self.current_entry, '_undo_stack', None):
-                self._undo_btn.setEnabled(False)
+        self._dirty = True
 
     def _on_editor_text_changed(self):
         """Handle editor content changes, creating a new entry if none exists."""
@@ -1235,10 +1404,13 @@ class MainWindow(QMainWindow):
             return
             
         # only create a new entry if there's non-empty content and no current entry
-        try:
-            plain = self.editor.toPlainText().strip()
-        except Exception:
-            plain = ''
+        # (the plain-text copy is only needed then; making it on every keystroke is slow)
+        plain = ''
+        if self.current_entry is None:
+            try:
+                plain = self.editor.toPlainText().strip()
+            except Exception:
+                plain = ''
         if plain and self.current_entry is None:
             # capture current HTML and create new entry
             html = self.editor.toHtml()
@@ -1246,6 +1418,7 @@ class MainWindow(QMainWindow):
             self.editor.blockSignals(True)
             try:
                 self.editor.setHtml(html)
+                self._just_loaded = True
                 QTimer.singleShot(0, self._recolor_all_links)
             finally:
                 self.editor.blockSignals(False)
@@ -1258,12 +1431,9 @@ class MainWindow(QMainWindow):
                 if item.data(Qt.ItemDataRole.UserRole) is self.current_entry:
                     self.entry_list.setCurrentItem(item)
                     break
-        # mark dirty
+        # mark dirty; links in the edited text are recolored via contentsChange
         if not getattr(self, '_suppress_dirty', False):
             self._dirty = True
-        
-        # Clean up link colors in HTML if present
-        QTimer.singleShot(50, self._recolor_all_links)
 
     def discard_current_entry(self):
         """Discard the current entry after confirmation."""
@@ -1274,8 +1444,9 @@ class MainWindow(QMainWindow):
             return
         # remove from DB if persisted
         try:
-            if getattr(self.current_entry, 'id', None):
-                self.db.delete_entry(self.current_entry.id)
+            entry_id = self.writer.discard(self.current_entry)
+            if entry_id:
+                self.db.delete_entry(entry_id)
         except Exception as e:
             QMessageBox.critical(self, "Discard failed", f"Could not discard entry: {e}")
             return
@@ -1302,6 +1473,11 @@ class MainWindow(QMainWindow):
                 self._autosave_timer.setInterval(max(5, interval) * 1000)
             except Exception:
                 pass
+            try:
+                self._doc_cache.resize(int(s.value("document_cache_size", DEFAULT_CACHE_SIZE)),  # type: ignore
+                                       int(s.value("document_cache_mb", DEFAULT_CACHE_MB)))  # type: ignore
+            except Exception:
+                pass
     
     def show_about(self):
         """Show an About dialog for the application."""
@@ -1321,6 +1497,13 @@ class MainWindow(QMainWindow):
     def show_statistics(self):
         """Show the journal statistics dialog."""
         from stats_dialog import StatsDialog
+        # word counts and tags come from the stored projections, not the bodies
+        while not self._entries_complete:
+            self._load_next_entry_page()
+        try:
+            self.db.load_projections(self.entries)
+        except Exception:
+            self._ensure_entries_loaded()
         dlg = StatsDialog(self.entries, self)
         dlg.exec()
 
@@ -1356,8 +1539,9 @@ class MainWindow(QMainWindow):
             reply = QMessageBox.question(self, "Delete", f"Permanently delete '{entry.title or 'Untitled'}'?")
             if reply == QMessageBox.StandardButton.Yes:
                 try:
-                    if getattr(entry, 'id', None):
-                        self.db.delete_entry(entry.id)
+                    entry_id = self.writer.discard(entry)
+                    if entry_id:
+                        self.db.delete_entry(entry_id)
                 except Exception as e:
                     QMessageBox.critical(self, "Delete failed", f"Could not delete entry: {e}")
                     return
@@ -1365,6 +1549,7 @@ class MainWindow(QMainWindow):
                     self.entries.remove(entry)
                 except Exception:
                     pass
+                self._doc_cache.discard(entry)
                 # if this was the currently selected entry, clear editor
                 if self.current_entry is entry:
                     self.current_entry = None
@@ -1378,9 +1563,13 @@ class MainWindow(QMainWindow):
     def _load_entry_list(self, entries: Optional[List] = None):
         """Populate the entry list widget with entries."""
         self.entry_list.clear()
-        to_show = entries or self.entries
+        self._list_shows_all = entries is None
+        to_show = self.entries if entries is None else entries
         to_show = sorted(to_show, key=lambda e: e.date, reverse=True)
-        
+        self._append_entry_items(to_show)
+
+    def _append_entry_items(self, to_show: List):
+        """Add list items for ``to_show`` to the end of the entry list."""
         s = QSettings("MyJourney", "App")
         df = s.value("default_font", "")
         df_size = int(s.value("default_font_size", 12))  # type: ignore
@@ -1417,35 +1606,95 @@ class MainWindow(QMainWindow):
         self._load_entry_list(filtered)
 
     def filter_by_search(self):
-        """Filter the entry list based on the search query with optimized HTML stripping."""
+        """Filter the entry list using the encrypted search index."""
         query = self.search.text().strip().lower()
         if not query:
             self._load_entry_list()
             return
-            
-        import re
-        tag_re = re.compile(r'<[^>]+>')
-        filtered = []
-        
-        for i, e in enumerate(self.entries):
-            # Keep UI responsive during large searches
-            if i % 50 == 0:
+        # results may include older entries not paged in or indexed yet
+        while not self._entries_complete:
+            self._load_next_entry_page()
+        try:
+            while self.db.index_pending_entries():
                 QApplication.processEvents()
-                
-            # Strip HTML tags for searching content
-            plain_content = tag_re.sub('', e.content).lower()
-            
-            if (query in e.title.lower() or
-                query in plain_content or
-                any(query in t.lower() for t in e.tags)):
-                filtered.append(e)
+            ids = self.db.search_entries(query)
+        except Exception:
+            ids = None
+        if ids is None:
+            # too short to look up in the index: match titles only
+            filtered = [e for e in self.entries if query in e.title.lower()]
+        else:
+            hits = set(ids)
+            # unsaved entries are not indexed yet, fall back to their title
+            filtered = [e for e in self.entries
+                        if e.id in hits or (e.id is None and query in e.title.lower())]
         self._load_entry_list(filtered)
 
+    def _index_next_batch(self):
+        """Index a batch of not-yet-indexed entries, then yield to the event loop."""
+        try:
+            if self.db.index_pending_entries():
+                QTimer.singleShot(0, self._index_next_batch)
+        except Exception:
+            pass
+
+    def _on_reencrypt_progress(self, done: int, total: int):
+        """Show how far the background re-encryption has got."""
+        if total:
+            self.statusBar().showMessage(f"Upgrading journal encryption... {done * 100 // total}%", 2000)
+
+    def _new_document(self) -> QTextDocument:
+        """Create an empty editor document styled like the current one."""
+        # parented to the editor so images resolve through its loadResource()
+        doc = QTextDocument(self.editor)
+        doc.setDefaultFont(self.editor.font())
+        doc.setDefaultStyleSheet(self.editor.document().defaultStyleSheet())
+        return doc
+
+    def _attach_document(self, doc: QTextDocument):
+        """Connect the window to the signals of the document on screen."""
+        # the document's own signal, which load_entry's blockSignals() does not mute
+        doc.undoAvailable.connect(self._undo_btn.setEnabled)
+        doc.contentsChange.connect(self._on_contents_change)
+        self._undo_btn.setEnabled(doc.isUndoAvailable())
+
+    def _show_document(self, doc: QTextDocument, entry: Optional[Entry]):
+        """Put ``doc`` on screen for ``entry`` and park the outgoing document.
+
+        The outgoing document is cached for the entry it showed when it
+        holds no unsaved edits; its undo history is dropped either way.
+        """
+        old = self.editor.document()
+        if old is doc:
+            return
+        try:
+            old.undoAvailable.disconnect(self._undo_btn.setEnabled)
+            old.contentsChange.disconnect(self._on_contents_change)
+        except Exception:
+            pass
+        self.editor.setDocument(doc)
+        self._attach_document(doc)
+        self._just_loaded = True
+        self._recolor_span = None
+        self._recolor_timer.stop()
+        leaving = self.current_entry
+        if (leaving is not None and leaving is not entry and not old.isModified()
+                and isinstance(leaving.content, str)):
+            old.clearUndoRedoStacks()
+            self._doc_cache.put(leaving, old, leaving.content)
+        else:
+            old.deleteLater()
+
     def load_entry(self, item: QListWidgetItem):
         """Load the selected entry into the editor."""
         entry = item.data(Qt.ItemDataRole.UserRole)
         if not entry:
             return
+        try:
+            self._ensure_entry_loaded(entry)
+        except Exception as e:
+            QMessageBox.critical(self, "Load failed", f"Could not load entry: {e}")
+            return
         
         self._initializing = True
         self.title_edit.blockSignals(True)
@@ -1453,13 +1702,20 @@ class MainWindow(QMainWindow):
         self.tags_edit.blockSignals(True)
         
         try:
+            doc = self._doc_cache.take(entry)
+            parsed = doc is None
+            if parsed:
+                doc = self._new_document()
+                doc.setHtml(entry.content)
+                doc.setModified(False)
+            self._show_document(doc, entry)
             self.current_entry = entry
             self.title_edit.setText(self.current_entry.title)
-            self.editor.setHtml(self.current_entry.content)
             self.tags_edit.setText(", ".join(self.current_entry.tags))
             self._refresh_attachment_list()
-            # Force link recoloring after loading HTML
-            QTimer.singleShot(0, self._recolor_all_links)
+            if parsed:
+                # recolor the loaded links right away rather than after the idle delay
+                QTimer.singleShot(0, self._recolor_all_links)
             # load per-entry font settings into UI and apply to editor
             s = QSettings("MyJourney", "App")
             df = s.value("default_font", "")
@@ -1490,6 +1746,9 @@ class MainWindow(QMainWindow):
                         self.editor.setFont(QFont(str(df), int(df_size)))
                     except Exception:
                         pass
+            # a cached document may predate a change of the default font
+            if doc.defaultFont() != self.editor.font():
+                doc.setDefaultFont(self.editor.font())
             # ensure title required note (no change) and keep UI consistent
             # apply tooltip from last_saved if present
             try:
@@ -1514,9 +1773,9 @@ class MainWindow(QMainWindow):
             today = str(datetime.today().date())
             new_e = Entry(entry_date=today)
             self.entries.append(new_e)
+            self._show_document(self._new_document(), new_e)
             self.current_entry = new_e
             self.title_edit.clear()
-            self.editor.clear()
             # apply app default font to the new/blank entry editor
             s = QSettings("MyJourney", "App")
             df = s.value("default_font", "")
@@ -1557,7 +1816,7 @@ class MainWindow(QMainWindow):
         if pix.width() > 1200:
             pix = pix.scaledToWidth(1200, Qt.TransformationMode.SmoothTransformation)
             
-        # Convert to base64
+        # Encode for storage
         from PySide6.QtCore import QBuffer, QIODevice
         ba = QByteArray()
         buffer = QBuffer(ba)
@@ -1568,10 +1827,23 @@ class MainWindow(QMainWindow):
             ext = "png"
         
         pix.save(buffer, ext.upper())
-        b64 = base64.b64encode(ba.data()).decode()
-        
-        html = f'<img src="data:image/{ext};base64,{b64}" />'
-        self.editor.textCursor().insertHtml(html)
+        self._insert_stored_image(ba.data(), f"image/{'jpeg' if ext == 'jpg' else ext}", pix)
+
+    def _insert_stored_image(self, data: bytes, mime: str, pix: QPixmap, width: int = 0):
+        """Store an image in the journal and insert a reference to it at the cursor."""
+        try:
+            img_id = self.db.store_image(bytes(data), mime)
+        except Exception as e:
+            QMessageBox.critical(self, "Insert failed", f"Could not store image: {e}")
+            return
+        url = image_url(img_id)
+        self.editor.document().addResource(QTextDocument.ResourceType.ImageResource, QUrl(url), pix)
+        imgfmt = QTextImageFormat()
+        imgfmt.setName(url)
+        if width and pix.width():
+            imgfmt.setWidth(width)
+            imgfmt.setHeight(int(pix.height() * (width / pix.width())))
+        self.editor.textCursor().insertImage(imgfmt)
         self._dirty = True
 
     def attach_file(self):
@@ -1581,11 +1853,17 @@ class MainWindow(QMainWindow):
         path, _ = QFileDialog.getOpenFileName(self, "Attach File")
         if not path:
             return
-        filename = os.path.basename(path)
-        with open(path, "rb") as f:
-            data = f.read()
         assert self.current_entry is not None
-        self.current_entry.attachments.append({"filename": filename, "data": data})
+        # stream the file into encrypted chunks instead of reading it whole
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            att = self.db.import_attachment(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Attach failed", f"Could not attach file: {e}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.current_entry.add_attachment(att)
         self._refresh_attachment_list()
         self._dirty = True
 
@@ -1597,21 +1875,24 @@ class MainWindow(QMainWindow):
         filename = att["filename"]
         if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
             # Insert image inline into editor
+            data = self.db.get_attachment_data(att["id"]) or b""
             pix = QPixmap()
-            pix.loadFromData(att["data"])
-            self.editor.document().addResource(QTextDocument.ResourceType.ImageResource, QUrl(filename), pix)
-            cursor = self.editor.textCursor()
-            imgfmt = QTextImageFormat()
-            imgfmt.setName(filename)
-            imgfmt.setWidth(min(pix.width(), 400))  # Limit width
-            imgfmt.setHeight(int(pix.height() * (imgfmt.width() / pix.width())))
-            cursor.insertImage(imgfmt)
+            pix.loadFromData(data)
+            if pix.isNull():
+                return
+            ext = os.path.splitext(filename)[1].lower().lstrip(".")
+            self._insert_stored_image(data, f"image/{'jpeg' if ext == 'jpg' else ext}", pix, min(pix.width(), 400))  # Limit width
         else:
             # Save as file
             save_path, _ = QFileDialog.getSaveFileName(self, "Save Attachment", filename)
             if save_path:
-                with open(save_path, "wb") as f:
-                    f.write(att["data"])
+                QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+                try:
+                    self.db.export_attachment(att["id"], save_path)
+                except Exception as e:
+                    QMessageBox.critical(self, "Save failed", f"Could not save attachment: {e}")
+                finally:
+                    QApplication.restoreOverrideCursor()
 
     def _attachment_context_menu(self, pos):
         """Show a context menu for the attachment list."""
@@ -1644,8 +1925,8 @@ class MainWindow(QMainWindow):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            # Remove from entry list
-            self.current_entry.attachments.pop(idx)
+            # Remove from entry list; the stored copy is deleted on next save
+            self.current_entry.remove_attachment(idx)
             self._dirty = True
             # Refresh the list UI
             self._refresh_attachment_list()
@@ -1659,14 +1940,21 @@ class MainWindow(QMainWindow):
             filename = att["filename"]
             item = QListWidgetItem(filename)
             item.setData(Qt.ItemDataRole.UserRole, i)
+            size = att.get("size")
+            if size is not None:
+                item.setToolTip(f"{size / 1024:.1f} KB")
             
             # Set icon based on file type
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')) and (size or 0) <= THUMBNAIL_MAX_BYTES:
                 try:
-                    pix = QPixmap()
-                    pix.loadFromData(att["data"])
-                    if not pix.isNull():
-                        icon = QIcon(pix.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+                    icon = self._thumbnails.get(att["id"])
+                    if icon is None:
+                        pix = QPixmap()
+                        pix.loadFromData(self.db.get_attachment_data(att["id"]) or b"")
+                        if not pix.isNull():
+                            icon = QIcon(pix.scaled(32, 32, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+                            self._thumbnails[att["id"]] = icon
+                    if icon is not None:
                         item.setIcon(icon)
                     else:
                         item.setIcon(self.style().standardIcon(self.style().StandardPixmap.SP_FileIcon))
@@ -1689,7 +1977,9 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Missing title", "Entries must have a title to save.")
             return
         self.current_entry.title = title_text
-        self.current_entry.content = self.editor.toHtml()
+        # serializing the document is costly; skip it when nothing was edited
+        if self.editor.document().isModified():
+            self.current_entry.content = self.editor.toHtml()
         tags = [t.strip() for t in self.tags_edit.text().split(",") if t.strip()]
         self.current_entry.tags = tags
         # save per-entry font metadata from UI
@@ -1707,16 +1997,24 @@ class MainWindow(QMainWindow):
             
         if show_message:
             self.statusBar().showMessage("Saving entry...", 0)
-            QApplication.processEvents()
-            
+            self._notify_saves.add(self.current_entry)
+
+        # encryption and the commit happen on the writer thread; the
+        # outcome arrives in _on_entry_saved / _on_entry_save_failed, possibly
+        # while the list below is refreshed, so clear the dirty flag first
+        self._dirty = False
+        self.editor.document().setModified(False)
         try:
-            self.db.save_entry(self.current_entry)
+            self.writer.submit(self.current_entry)
         except Exception as e:
+            self._notify_saves.discard(self.current_entry)
+            self._dirty = True
+            self.editor.document().setModified(True)
             if show_message:
                 QMessageBox.critical(self, "Save failed", f"Could not save entry: {e}")
             return
-            
-        # Only reload UI lists if this is a manual save or if we need to update the calendar
+
+        # Only reload UI lists if this is a manual save
         if show_message:
             self._load_entry_list()
         else:
@@ -1726,28 +2024,49 @@ class MainWindow(QMainWindow):
                 if item.data(Qt.ItemDataRole.UserRole) == self.current_entry:
                     item.setText(f"{self.current_entry.date} - {self.current_entry.title or 'Untitled'}")
                     break
-            self._load_calendar_dates()
-            
-        # clear dirty flag
-        self._dirty = False
-        if not show_message:
+
+    def _on_entry_saved(self, entry: Entry, saved: Entry):
+        """Record a finished background save and report manual saves."""
+        entry.apply_saved(saved)
+        self._load_calendar_dates()
+        if entry not in self._notify_saves:
             return
+        self._notify_saves.discard(entry)
+        self.statusBar().clearMessage()
         QMessageBox.information(self, "Saved", "Entry saved successfully.")
         # also show last-saved in the status bar briefly
         try:
-            if getattr(self.current_entry, 'last_saved', None):
-                self.statusBar().showMessage(f"Saved at {self.current_entry.last_saved}", 4000)
+            if getattr(saved, 'last_saved', None):
+                self.statusBar().showMessage(f"Saved at {saved.last_saved}", 4000)
         except Exception:
             pass
 
+    def _on_entry_save_failed(self, entry: Entry, error: str):
+        """Report a failed background save; the entry stays dirty."""
+        if entry is self.current_entry:
+            self._dirty = True
+        if entry in self._notify_saves:
+            self._notify_saves.discard(entry)
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "Save failed", f"Could not save entry: {error}")
+        else:
+            try:
+                self.statusBar().showMessage(f"Autosave failed: {error}", 4000)
+            except Exception:
+                pass
+
     def delete_entry(self):
         """Delete the current entry after confirmation."""
-        if not self.current_entry or self.current_entry.id is None:
+        if not self.current_entry:
+            return
+        if self.current_entry.id is None and not self.writer.is_pending(self.current_entry):
             return
         reply = QMessageBox.question(self, "Delete", "Permanently delete this entry?")
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                self.db.delete_entry(self.current_entry.id)
+                entry_id = self.writer.discard(self.current_entry)
+                if entry_id:
+                    self.db.delete_entry(entry_id)
             except Exception as e:
                 QMessageBox.critical(self, "Delete failed", f"Could not delete entry: {e}")
                 return
@@ -1796,157 +2115,169 @@ class MainWindow(QMainWindow):
         if not format_choice:
             return
         
+        self._ensure_entries_loaded()
         self._export_entries_to_format(self.entries, format_choice)
     
     def _export_entries_to_format(self, entries, format_choice: str):
         """Export given entries to the specified format."""
-        if format_choice == "PDF":
-            self._export_to_pdf(entries)
-        elif format_choice == "HTML":
-            self._export_to_html(entries)
-        elif format_choice == "RTF":
-            self._export_to_rtf(entries)
-        elif format_choice == "Markdown":
-            self._export_to_markdown(entries)
-    
-    def _export_to_pdf(self, entries):
-        """Export entries to PDF format."""
-        from PySide6.QtGui import QPdfWriter, QPageSize
-        from PySide6.QtCore import QMarginsF
-        
-        filename = "all_entries.pdf" if len(entries) > 1 else f"{entries[0].title or 'entry'}.pdf"
-        path, _ = QFileDialog.getSaveFileName(self, "Export to PDF", filename, "PDF (*.pdf)")
-        
+        from exporters import EXPORT_FORMATS
+        ext, file_filter, writer = EXPORT_FORMATS[format_choice]
+        filename = f"all_entries{ext}" if len(entries) > 1 else f"{entries[0].title or 'entry'}{ext}"
+        path, _ = QFileDialog.getSaveFileName(self, f"Export to {format_choice}", filename, file_filter)
+
         if not path:
             return
-        
-        if not path.lower().endswith(".pdf"):
-            path += ".pdf"
-        
-        writer = QPdfWriter(path)
-        writer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
-        writer.setPageMargins(QMarginsF(15, 15, 15, 15))
-        
-        # Combine all entries into one document
-        combined_html = ""
-        for i, entry in enumerate(entries):
-            if i > 0:
-                combined_html += "<div style='page-break-before: always;'></div>"
-            combined_html += f"<h1>{entry.title}</h1>"
-            combined_html += f"<p><i>{entry.date}</i></p>"
-            combined_html += entry.content
-            combined_html += "<hr/>"
-        
-        doc = QTextDocument()
-        doc.setHtml(combined_html)
-        doc.print_(writer)
-        
+
+        if not path.lower().endswith(ext):
+            path += ext
+
+        writer(entries, path, self.db.inline_images)
+
         QMessageBox.information(self, "Export", f"{len(entries)} entry(ies) exported to {path}")
-    
-    def _export_to_html(self, entries):
-        """Export entries to HTML format."""
-        filename = "all_entries.html" if len(entries) > 1 else f"{entries[0].title or 'entry'}.html"
-        path, _ = QFileDialog.getSaveFileName(self, "Export to HTML", filename, "HTML (*.html)")
-        
-        if not path:
+
+    def backup_db(self, incremental: bool = False):
+        """Create an encrypted backup of the database.
+
+        An incremental backup holds only what changed since the previous
+        backup; restoring needs the full backup and every later one.
+        """
+        from PySide6.QtWidgets import QInputDialog
+        password, ok = QInputDialog.getText(self, "Backup Password", "Enter a password to encrypt the backup:", QLineEdit.EchoMode.Password)
+        if not ok or not password:
             return
-        
-        if not path.lower().endswith(".html"):
-            path += ".html"
-        
-        html = "<html><head><meta charset='utf-8'><title>Journal Export</title></head><body>"
-        for i, entry in enumerate(entries):
-            if i > 0:
-                html += "<div style='page-break-before: always;'></div>"
-            html += f"<h1>{entry.title}</h1>"
-            html += f"<p><i>{entry.date}</i></p>"
-            html += entry.content
-            html += "<hr/>"
-        html += "</body></html>"
-        
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(html)
-        
-        QMessageBox.information(self, "Export", f"{len(entries)} entry(ies) exported to {path}")
-    
-    def _export_to_rtf(self, entries):
-        """Export entries to RTF format."""
-        filename = "all_entries.rtf" if len(entries) > 1 else f"{entries[0].title or 'entry'}.rtf"
-        path, _ = QFileDialog.getSaveFileName(self, "Export to RTF", filename, "RTF (*.rtf)")
-        
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        default = f"myjourney_{'delta' if incremental else 'backup'}_{stamp}.enc"
+        path, _ = QFileDialog.getSaveFileName(self, "Incremental Backup" if incremental else "Backup Database", default)
         if not path:
             return
-        
-        if not path.lower().endswith(".rtf"):
-            path += ".rtf"
-        
-        # Create a QTextDocument and set the combined content
-        combined_html = ""
-        for i, entry in enumerate(entries):
-            if i > 0:
-                combined_html += "<div style='page-break-before: always;'></div>"
-            combined_html += f"<h1>{entry.title}</h1>"
-            combined_html += f"<p><i>{entry.date}</i></p>"
-            combined_html += entry.content
-            combined_html += "<hr/>"
-        
-        doc = QTextDocument()
-        doc.setHtml(combined_html)
-        
-        # Write to RTF using QTextDocumentWriter
-        from PySide6.QtGui import QTextDocumentWriter
-        writer = QTextDocumentWriter(path, b"rtf")
-        writer.write(doc)
-        
-        QMessageBox.information(self, "Export", f"{len(entries)} entry(ies) exported to {path}")
-    
-    def _export_to_markdown(self, entries):
-        """Export entries to Markdown format."""
-        filename = "all_entries.md" if len(entries) > 1 else f"{entries[0].title or 'entry'}.md"
-        path, _ = QFileDialog.getSaveFileName(self, "Export to Markdown", filename, "Markdown (*.md)")
-        
-        if not path:
+        if self.backup_job is not None:
+            QMessageBox.information(self, "Backup", "A backup is already running.")
             return
-        
-        if not path.lower().endswith(".md"):
-            path += ".md"
-        
-        md_content = ""
-        for entry in entries:
-            md_content += f"# {entry.title}\n\n"
-            md_content += f"*{entry.date}*\n\n"
-            
-            # Convert HTML to Markdown
-            doc = QTextDocument()
-            doc.setHtml(entry.content)
-            md_content += doc.toMarkdown()
-            md_content += "\n\n---\n\n"
-        
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(md_content)
-        
-        QMessageBox.information(self, "Export", f"{len(entries)} entry(ies) exported to {path}")
-
-    def backup_db(self):
-        """Create an encrypted backup of the database."""
+        # snapshot, encryption and writing all happen on the job's thread
+        from backup import BackupJob
+        job = BackupJob(self.db, path, password, incremental, self)
+        progress = QProgressDialog("Backing up journal...", "Cancel", 0, 1000, self)
+        progress.setWindowTitle("Backup")
+        progress.setMinimumDuration(500)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.canceled.connect(job.cancel)
+
+        def on_progress(done: int, total: int):
+            if total:
+                progress.setValue(done * 1000 // total)
+
+        def on_done(message: str | None):
+            progress.close()
+            self.backup_job = None
+            if message is None:
+                QMessageBox.information(self, "Backup", "Encrypted database backed up. Store the password securely!")
+            elif message != "Backup cancelled":
+                QMessageBox.critical(self, "Backup", f"Backup failed: {message}")
+
+        job.progress.connect(on_progress)
+        job.finished.connect(lambda _path: on_done(None))
+        job.failed.connect(on_done)
+        self.backup_job = job
+        job.start()
+
+    def restore_backup(self):
+        """Replace the journal with the contents of a backup.
+
+        The backups are decrypted and checked chunk by chunk into a new
+        file on a background thread; the journal is only replaced once
+        that file has passed an integrity check. The app then closes, as
+        the restored journal may use a different master password.
+        """
         from PySide6.QtWidgets import QInputDialog
-        password, ok = QInputDialog.getText(self, "Backup Password", "Enter a password to encrypt the backup:", QLineEdit.EchoMode.Password)
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, "Restore Backup (select a full backup and any incremental backups made after it)", "",
+            "Backups (*.enc);;All files (*)")
+        if not paths:
+            return
+        password, ok = QInputDialog.getText(self, "Backup Password", "Enter the password the backup was made with:",
+                                            QLineEdit.EchoMode.Password)
         if not ok or not password:
             return
-        path, _ = QFileDialog.getSaveFileName(self, "Backup Database", "myjourney_backup.enc")
-        if path:
-            from encryption import EncryptionManager
-            salt = EncryptionManager.generate_salt()
-            enc = EncryptionManager(password, salt)
-            with open("myjourney.db", "rb") as f:
-                data = f.read()
-            encrypted_data = enc.encrypt_data(data)
-            with open(path, "wb") as f:
-                f.write(salt + encrypted_data)  # Prepend salt
-            QMessageBox.information(self, "Backup", "Encrypted database backed up. Store the password securely!")
+        reply = QMessageBox.question(
+            self, "Restore Backup",
+            "Replace the whole journal with the backup? Changes made since the backup will be lost.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        from backup import RestoreJob
+        job = RestoreJob(paths, password, self.db.path, self)
+        progress = QProgressDialog("Restoring journal...", "", 0, 1000, self)
+        progress.setWindowTitle("Restore Backup")
+        progress.setCancelButton(None)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+
+        def on_progress(done: int, total: int):
+            if total:
+                progress.setValue(done * 1000 // total)
+
+        def on_finished(restored: str):
+            progress.close()
+            self.setEnabled(True)
+            try:
+                self._stop_background_work()
+                self.db.replace_with(restored)
+            except Exception as e:
+                QMessageBox.critical(self, "Restore Backup", f"Could not replace the journal: {e}")
+                return
+            QMessageBox.information(self, "Restore Backup",
+                                    "The journal was restored. MyJourney will now close; log in again with the "
+                                    "master password that was in use when the backup was made.")
+            self.close()
+
+        def on_failed(message: str):
+            progress.close()
+            self.setEnabled(True)
+            QMessageBox.critical(self, "Restore Backup", f"Restore failed: {message}")
+
+        job.progress.connect(on_progress)
+        job.finished.connect(on_finished)
+        job.failed.connect(on_failed)
+        self._restore_job = job
+        # a modal progress dialog would handle events inside setValue(),
+        # so keep the window disabled instead
+        self.setEnabled(False)
+        job.start()
+
+    def change_password(self):
+        """Change the master password.
+
+        Only the wrapped data key is rewritten, so this takes the time of
+        two key derivations however large the journal is.
+        """
+        from auth import ChangePasswordDialog, run_in_background
+        dlg = ChangePasswordDialog(self)
+        if not dlg.exec():
+            return
+
+        def change(current, new):
+            try:
+                self.db.change_password(current, new)
+            finally:
+                self.db.release_reader()
+
+        try:
+            run_in_background("Changing password...", change, dlg.current.text(), dlg.password)
+        except (ValueError, RuntimeError) as e:
+            QMessageBox.warning(self, "Change Password", str(e))
+            return
+        except Exception as e:
+            QMessageBox.critical(self, "Change Password", f"Could not change the password: {e}")
+            return
+        QMessageBox.information(self, "Change Password", "Master password changed. Use it the next time you log in.")
 
     def _logout_due_to_inactivity(self):
         """Logout due to inactivity by closing the window."""
+        # write the open entry now; the message below may stay up unattended
+        self._autosave()
+        self.writer.flush()
         QMessageBox.information(self, "Session Expired", "You have been logged out due to inactivity.")
         self.close()
         # Since the main loop is in main.py, this will exit the app
@@ -1968,6 +2299,24 @@ class MainWindow(QMainWindow):
         self._apply_theme()
         self._load_calendar_dates()
 
+    def _stop_background_work(self):
+        """Stop timers and background jobs, finishing queued saves."""
+        self._autosave_timer.stop()
+        # let queued saves land before the database is closed or replaced
+        self.writer.flush()
+        if self.reencrypt_job is not None:
+            self.reencrypt_job.stop()
+        if self.backup_job is not None:
+            self.backup_job.stop()
+        self.writer.stop()
+
+    def closeEvent(self, event):
+        """Finish background saves before the window goes away."""
+        self._stop_background_work()
+        # parked documents hold decrypted entry text
+        self._doc_cache.clear()
+        super().closeEvent(event)
+
     def event(self, event: QEvent) -> bool:
         """Override to reset inactivity timer on user activity."""
         if event.type() in (QEvent.Type.MouseMove, QEvent.Type.MouseButtonPress, QEvent.Type.KeyPress):
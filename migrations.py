@@ -0,0 +1,218 @@
+"""Versioned schema migrations for the MyJournal database.
+
+The schema version is kept in SQLite's ``PRAGMA user_version``.
+`migrate()` runs every migration newer than the stored version, each in
+its own transaction together with the version bump, so the schema is
+checked once per start-up by `DatabaseManager.init_db()` and never on
+the read path.
+
+To change the schema, append a function to `MIGRATIONS`; never edit or
+reorder one that has shipped. Databases created before versioning
+report version 0 and may already contain any part of migrations 1-3,
+which is why those use the tolerant `_add_column()` helper.
+"""
+
+import sqlite3
+
+
+def _add_column(cur: sqlite3.Cursor, table: str, column: str, decl: str):
+    """Add ``column`` to ``table`` unless an older release already did."""
+    cols = [r[1] for r in cur.execute(f"PRAGMA table_info({table})")]
+    if column not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _base_schema(cur: sqlite3.Cursor):
+    """Config, entries and attachments tables of the first release."""
+    cur.execute("""CREATE TABLE IF NOT EXISTS config (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        salt BLOB,
+        totp_secret BLOB
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        encrypted_title BLOB,
+        encrypted_content BLOB,
+        encrypted_tags BLOB
+    )""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS attachments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entry_id INTEGER,
+        filename TEXT NOT NULL,
+        encrypted_data BLOB NOT NULL,
+        FOREIGN KEY(entry_id) REFERENCES entries(id) ON DELETE CASCADE
+    )""")
+    # per-entry font settings and last-saved time
+    for col in ("encrypted_font_family", "encrypted_font_size", "encrypted_last_saved"):
+        _add_column(cur, "entries", col, "BLOB")
+
+
+def _paging_and_chunks(cur: sqlite3.Cursor):
+    """Index the entry listing and store attachments in chunks."""
+    # keeps the newest-first summary listing an index walk
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(date, id)")
+    # plaintext size, so listings never have to touch the blob
+    _add_column(cur, "attachments", "size", "INTEGER")
+    # 1 = data lives in attachment_chunks, 0 = legacy single token in encrypted_data
+    _add_column(cur, "attachments", "chunked", "INTEGER NOT NULL DEFAULT 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attachments_entry_id ON attachments(entry_id)")
+    cur.execute("""CREATE TABLE IF NOT EXISTS attachment_chunks (
+        attachment_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        encrypted_data BLOB NOT NULL,
+        PRIMARY KEY (attachment_id, seq),
+        FOREIGN KEY(attachment_id) REFERENCES attachments(id) ON DELETE CASCADE
+    )""")
+
+
+def _search_and_projection(cur: sqlite3.Cursor):
+    """Blind-token search index and cached plain-text projections."""
+    # encrypted JSON of the entry's plain text and word count (see plain_text.py)
+    _add_column(cur, "entries", "encrypted_projection", "BLOB")
+    # 0 until the entry's words are in search_index
+    _add_column(cur, "entries", "indexed", "INTEGER NOT NULL DEFAULT 0")
+    cur.execute("""CREATE TABLE IF NOT EXISTS search_index (
+        token BLOB NOT NULL,
+        entry_id INTEGER NOT NULL,
+        PRIMARY KEY (token, entry_id)
+    ) WITHOUT ROWID""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_search_index_entry_id ON search_index(entry_id)")
+
+
+def _unindexed_entries(cur: sqlite3.Cursor):
+    """Let the background indexer find unindexed entries without a scan."""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_entries_unindexed ON entries(id) WHERE indexed = 0")
+
+
+def _image_store(cur: sqlite3.Cursor):
+    """Content-addressed store for images embedded in entry bodies."""
+    # id is a keyed hash of the image bytes (see inline_images.py)
+    cur.execute("""CREATE TABLE images (
+        id TEXT PRIMARY KEY,
+        mime TEXT NOT NULL,
+        encrypted_data BLOB NOT NULL
+    )""")
+    # which entries reference which images; unreferenced images are dropped
+    cur.execute("""CREATE TABLE entry_images (
+        entry_id INTEGER NOT NULL,
+        image_id TEXT NOT NULL,
+        PRIMARY KEY (entry_id, image_id),
+        FOREIGN KEY(entry_id) REFERENCES entries(id) ON DELETE CASCADE
+    ) WITHOUT ROWID""")
+    cur.execute("CREATE INDEX idx_entry_images_image_id ON entry_images(image_id)")
+
+
+def _storage_format(cur: sqlite3.Cursor):
+    """Record the ciphertext format and re-encryption progress in config."""
+    # format every stored value is known to be in; NULL for journals
+    # written before it was tracked (Fernet)
+    cur.execute("ALTER TABLE config ADD COLUMN storage_format TEXT")
+    # JSON checkpoint of an unfinished re-encryption (see DatabaseManager.reencrypt_batch)
+    cur.execute("ALTER TABLE config ADD COLUMN reencrypt_state TEXT")
+
+
+def _key_wrapping(cur: sqlite3.Cursor):
+    """Store the journal's data key, wrapped by the password key."""
+    # NULL for journals still encrypted directly under the password key
+    cur.execute("ALTER TABLE config ADD COLUMN wrapped_key BLOB")
+
+
+# tracked table -> (change-log table name, key column, columns whose
+# updates count as changes or None for all), as read by backups. It
+# must describe the triggers the migrations created; `_change_tracking`
+# keeps its own copy because a shipped migration must not change.
+TRACKED_TABLES = {
+    "config": ("config", "id", None),
+    # the search index is derived and rebuilt on restore, so toggling
+    # `indexed` is not a change
+    "entries": ("entries", "id", ("date", "encrypted_title", "encrypted_content", "encrypted_tags",
+                                  "encrypted_font_family", "encrypted_font_size", "encrypted_last_saved",
+                                  "encrypted_projection")),
+    "entry_images": ("entries", "entry_id", None),
+    "attachments": ("attachments", "id", None),
+    "attachment_chunks": ("attachments", "attachment_id", None),
+    "images": ("images", "id", None),
+}
+
+
+def _change_tracking(cur: sqlite3.Cursor):
+    """Log which rows changed, for incremental backups (see backup.py)."""
+    # one row per changed row, stamped with an increasing sequence number;
+    # deleted rows keep theirs, so a delta can replay the deletion
+    cur.execute("""CREATE TABLE changes (
+        tbl TEXT NOT NULL,
+        row_key NOT NULL,
+        seq INTEGER NOT NULL,
+        PRIMARY KEY (tbl, row_key)
+    ) WITHOUT ROWID""")
+    cur.execute("CREATE INDEX idx_changes_seq ON changes(seq)")
+    # backups made of this journal, newest last; deltas build on the newest
+    cur.execute("""CREATE TABLE backups (
+        id TEXT PRIMARY KEY,
+        parent TEXT,
+        kind INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        schema_version INTEGER NOT NULL,
+        created TEXT NOT NULL
+    )""")
+    # (table, change-log table name, key column, columns whose updates count)
+    tracked = [
+        ("config", "config", "id", None),
+        ("entries", "entries", "id", ("date", "encrypted_title", "encrypted_content", "encrypted_tags",
+                                      "encrypted_font_family", "encrypted_font_size", "encrypted_last_saved",
+                                      "encrypted_projection")),
+        ("entry_images", "entries", "entry_id", None),
+        ("attachments", "attachments", "id", None),
+        ("attachment_chunks", "attachments", "attachment_id", None),
+        ("images", "images", "id", None),
+    ]
+    for table, tbl, key, columns in tracked:
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            target = f"UPDATE OF {', '.join(columns)}" if event == "UPDATE" and columns else event
+            cur.execute(f"""CREATE TRIGGER track_{table}_{event.lower()} AFTER {target} ON {table} BEGIN
+                INSERT OR REPLACE INTO changes (tbl, row_key, seq)
+                VALUES ('{tbl}', {row}.{key}, (SELECT IFNULL(MAX(seq), 0) + 1 FROM changes));
+            END""")
+
+
+# MIGRATIONS[n] upgrades a database from version n to n + 1
+MIGRATIONS = [
+    _base_schema,
+    _paging_and_chunks,
+    _search_and_projection,
+    _unindexed_entries,
+    _image_store,
+    _storage_format,
+    _key_wrapping,
+    _change_tracking,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version stored in the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Bring the database up to `SCHEMA_VERSION`; returns the version it started at.
+
+    Raises RuntimeError if the database was written by a newer release.
+    """
+    start = schema_version(conn)
+    if start > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {start} is newer than this app supports ({SCHEMA_VERSION}).")
+    if conn.in_transaction:
+        conn.commit()
+    for version in range(start, SCHEMA_VERSION):
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            MIGRATIONS[version](cur)
+            cur.execute(f"PRAGMA user_version = {version + 1}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    return start
@@ -0,0 +1,35 @@
+"""Plain-text projection of journal entries.
+
+Search, statistics and exports work on the visible text of an entry
+rather than its HTML. The projection (text plus word count) is computed
+once when an entry is saved and stored encrypted next to it. Bump
+``PROJECTION_VERSION`` whenever the extraction rules change so stored
+projections get recomputed.
+"""
+
+import html
+import re
+
+PROJECTION_VERSION = 1
+
+_HEAD_RE = re.compile(r"<(head|style|script)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+# tags that end a line of text; all other tags are dropped in place
+_BREAK_RE = re.compile(r"<(?:br|p|div|li|tr|h[1-6])\b[^>]*>|</(?:p|div|li|tr|td|th|h[1-6])>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+def html_to_text(content: str) -> str:
+    """Return the visible text of an entry's HTML body."""
+    text = _HEAD_RE.sub("", content)
+    text = _BREAK_RE.sub("\n", text)
+    text = html.unescape(_TAG_RE.sub("", text))
+    text = _SPACES_RE.sub(" ", text)
+    return _BLANK_LINES_RE.sub("\n", text).strip()
+
+
+def make_projection(content: str) -> dict:
+    """Build the stored projection of an HTML body."""
+    text = html_to_text(content)
+    return {"v": PROJECTION_VERSION, "text": text, "words": len(text.split())}
@@ -0,0 +1,58 @@
+"""Background conversion of stored values to the current ciphertext format.
+
+Journals written by older releases hold Fernet tokens, which still
+decrypt but are slower to read than the AEAD envelope new values are
+written in. `ReencryptJob` rewrites them on a dedicated thread in small
+batches through `DatabaseManager.reencrypt_batch()`. Every batch commits
+its own checkpoint, so closing the app part-way loses nothing and the
+next start continues where this one stopped.
+"""
+
+import threading
+from PySide6.QtCore import QObject, Signal
+
+# pause between batches so saves from the editor get the write lock promptly
+BATCH_PAUSE = 0.05
+
+
+class ReencryptJob(QObject):
+    """Re-encrypt the database behind ``db`` on a background thread.
+
+    ``progress`` is emitted with the rows done and the total after each
+    batch, ``finished`` once the whole database is converted, and
+    ``failed`` with an error message if a batch raised.
+    """
+
+    progress = Signal(int, int)
+    finished = Signal()
+    failed = Signal(str)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ReencryptJob", daemon=True)
+
+    def start(self):
+        """Start converting; returns immediately."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the batch in progress; its checkpoint is kept."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                state = self.db.reencrypt_batch()
+                if state is None:
+                    self.finished.emit()
+                    return
+                self.progress.emit(state["done"], state["total"])
+                self._stop.wait(BATCH_PAUSE)
+        except Exception as e:
+            self.failed.emit(str(e) or type(e).__name__)
+        finally:
+            self.db.release_reader()
@@ -0,0 +1,56 @@
+"""Encrypted full-text search index for MyJournal.
+
+Words from an entry's title, body and tags are turned into blind tokens:
+truncated HMAC-SHA256 digests keyed with a secret derived from the
+journal key. The database stores only ``(token, entry_id)`` postings, so
+a search hashes the query words the same way and looks the tokens up
+without decrypting any entry. Every prefix of a word (within the limits
+below) is indexed so results update while the user is still typing.
+"""
+
+import hashlib
+import hmac
+import re
+
+# Shortest and longest word prefixes that get their own token. Query
+# words longer than the maximum are matched on their first
+# ``MAX_PREFIX`` characters.
+MIN_PREFIX = 2
+MAX_PREFIX = 10
+# Bytes of the HMAC digest kept per token
+TOKEN_SIZE = 8
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def words(text: str) -> set[str]:
+    """Split ``text`` into the set of lower-cased words it contains."""
+    return set(_WORD_RE.findall(text.lower()))
+
+
+class SearchIndex:
+    """Compute blind search tokens with a secret ``key``."""
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def _token(self, term: str) -> bytes:
+        return hmac.new(self.key, term.encode("utf-8"), hashlib.sha256).digest()[:TOKEN_SIZE]
+
+    def entry_tokens(self, title: str, text: str, tags: list[str]) -> set[bytes]:
+        """Return the tokens under which an entry should be found.
+
+        ``text`` is the entry's plain-text projection, not its HTML.
+        """
+        terms = set()
+        for word in words(" ".join([title, text, *tags])):
+            for n in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1):
+                terms.add(word[:n])
+        return {self._token(t) for t in terms}
+
+    def query_tokens(self, query: str) -> list[bytes]:
+        """Return one token per searchable word of ``query``.
+
+        Words shorter than `MIN_PREFIX` are not indexed and are skipped.
+        """
+        return [self._token(w[:MAX_PREFIX]) for w in sorted(words(query)) if len(w) >= MIN_PREFIX]
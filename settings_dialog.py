@@ -5,6 +5,7 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtGui import QFont
 from PySide6.QtCore import Qt, QSettings
+from document_cache import DEFAULT_CACHE_SIZE, DEFAULT_CACHE_MB
 
 class SettingsDialog(QDialog):
     """Dialog to pick theme colors and store them in QSettings.
@@ -107,6 +108,18 @@ class SettingsDialog(QDialog):
         inactivity_row.addWidget(self.inactivity_timeout)
         layout.addLayout(inactivity_row)
 
+        # Recently viewed entries kept parsed for fast switching
+        cache_row = QHBoxLayout()
+        cache_row.addWidget(QLabel("Keep recent entries open:"))
+        self.document_cache_size = QSpinBox()
+        self.document_cache_size.setRange(0, 100)
+        cache_row.addWidget(self.document_cache_size)
+        cache_row.addWidget(QLabel("Memory limit (MB):"))
+        self.document_cache_mb = QSpinBox()
+        self.document_cache_mb.setRange(1, 4096)
+        cache_row.addWidget(self.document_cache_mb)
+        layout.addLayout(cache_row)
+
         # Theme save/load
         theme_row = QHBoxLayout()
         self.save_theme_btn = QPushButton("Save Theme")
@@ -121,6 +134,7 @@ class SettingsDialog(QDialog):
         self._refresh_buttons()
         self._refresh_autosave()
         self._refresh_inactivity()
+        self._refresh_document_cache()
 
         buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         buttons.accepted.connect(self.accept)
@@ -152,6 +166,10 @@ class SettingsDialog(QDialog):
     def _refresh_inactivity(self):
         self.inactivity_timeout.setValue(self._as_int("inactivity_timeout", 30))
 
+    def _refresh_document_cache(self):
+        self.document_cache_size.setValue(self._as_int("document_cache_size", DEFAULT_CACHE_SIZE))
+        self.document_cache_mb.setValue(self._as_int("document_cache_mb", DEFAULT_CACHE_MB))
+
     def choose_color(self, key: str):
         current = self.s.value(key, "#000000")
         # Use QColorDialog to pick a color
@@ -193,4 +211,7 @@ class SettingsDialog(QDialog):
         self.s.setValue("autosave_interval", self.autosave_interval.value())
         # save inactivity timeout
         self.s.setValue("inactivity_timeout", self.inactivity_timeout.value())
+        # save document cache limits
+        self.s.setValue("document_cache_size", self.document_cache_size.value())
+        self.s.setValue("document_cache_mb", self.document_cache_mb.value())
         super().accept()
\ No newline at end of file
@@ -1,8 +1,41 @@
 from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QGridLayout, QFrame, QCheckBox, QWidget
-from PySide6.QtGui import QTextDocument
 from collections import Counter
+from plain_text import make_projection
 import datetime
 
+
+def compute_stats(entries) -> dict:
+    """Aggregate word counts, tags and monthly activity of ``entries``."""
+    total_words = 0
+    all_tags = []
+    entries_by_month = Counter()
+
+    for entry in entries:
+        # Word count, from the cached projection when available
+        words = getattr(entry, 'word_count', None)
+        if words is None:
+            words = make_projection(entry.content)["words"]
+        total_words += words
+
+        # Tags
+        all_tags.extend(entry.tags)
+
+        # Month
+        try:
+            dt = datetime.datetime.strptime(entry.date, "%Y-%m-%d")
+            entries_by_month[dt.strftime("%Y-%m")] += 1
+        except Exception:
+            pass
+
+    return {
+        "total_entries": len(entries),
+        "total_words": total_words,
+        "avg_words": total_words / len(entries) if entries else 0,
+        "most_common_tags": Counter(all_tags).most_common(5),
+        "entries_by_month": entries_by_month,
+    }
+
+
 class StatsDialog(QDialog):
     """A dialog showing journal statistics."""
     
@@ -17,30 +50,12 @@ class StatsDialog(QDialog):
         layout = QVBoxLayout(self)
         
         # Calculate stats
-        total_entries = len(self.entries)
-        total_words = 0
-        all_tags = []
-        entries_by_month = Counter()
-        
-        for entry in self.entries:
-            # Word count
-            doc = QTextDocument()
-            doc.setHtml(entry.content)
-            text = doc.toPlainText()
-            total_words += len(text.split())
-            
-            # Tags
-            all_tags.extend(entry.tags)
-            
-            # Month
-            try:
-                dt = datetime.datetime.strptime(entry.date, "%Y-%m-%d")
-                entries_by_month[dt.strftime("%Y-%m")] += 1
-            except Exception:
-                pass
-                
-        avg_words = total_words / total_entries if total_entries > 0 else 0
-        most_common_tags = Counter(all_tags).most_common(5)
+        stats = compute_stats(self.entries)
+        total_entries = stats["total_entries"]
+        total_words = stats["total_words"]
+        avg_words = stats["avg_words"]
+        most_common_tags = stats["most_common_tags"]
+        entries_by_month = stats["entries_by_month"]
         
         # UI Elements
         grid = QGridLayout()
@@ -0,0 +1,106 @@
+"""Background writer for journal entries.
+
+Encrypting and committing a large entry takes long enough to stall
+typing when it happens on the GUI thread. `EntryWriter` takes a
+snapshot of an entry on the calling thread and saves it on a dedicated
+thread instead. Saves of the same entry that queue up while another
+write is running collapse into the most recent snapshot, and results
+come back through Qt signals, which are delivered on the GUI thread.
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from PySide6.QtCore import QObject, Signal
+from entry import Entry
+
+
+class EntryWriter(QObject):
+    """Save entries through ``db`` on a background thread.
+
+    ``saved`` is emitted with the live entry and the snapshot that was
+    written (pass it to `Entry.apply_saved()`); ``failed`` is emitted
+    with the live entry and an error message.
+    """
+
+    saved = Signal(object, object)
+    failed = Signal(object, str)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._cond = threading.Condition()
+        # live entry -> newest snapshot waiting to be written
+        self._pending: "OrderedDict[Entry, Entry]" = OrderedDict()
+        self._active: Entry | None = None
+        # ids assigned to new entries whose `saved` signal may not have
+        # been handled yet, so later snapshots update instead of insert
+        self._ids: "weakref.WeakKeyDictionary[Entry, int]" = weakref.WeakKeyDictionary()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="EntryWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: Entry):
+        """Queue ``entry`` for saving, replacing an older queued snapshot."""
+        snapshot = entry.snapshot()
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("EntryWriter has been stopped")
+            self._pending[entry] = snapshot
+            self._cond.notify_all()
+
+    def is_pending(self, entry: Entry) -> bool:
+        """Return True while a save of ``entry`` is queued or running."""
+        with self._cond:
+            return entry in self._pending or self._active is entry
+
+    def discard(self, entry: Entry) -> int | None:
+        """Drop queued saves of ``entry`` and wait for a running one.
+
+        Returns the entry's database id, if it has one, so the caller
+        can delete it without a save landing afterwards.
+        """
+        with self._cond:
+            self._pending.pop(entry, None)
+            while self._active is entry:
+                self._cond.wait()
+            return entry.id if entry.id is not None else self._ids.get(entry)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every queued save has been written.
+
+        Returns False if ``timeout`` seconds passed first.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and self._active is None, timeout)
+
+    def stop(self):
+        """Write everything still queued, then end the writer thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    self.db.release_reader()
+                    return
+                entry, snapshot = self._pending.popitem(last=False)
+                self._active = entry
+                if snapshot.id is None:
+                    snapshot.id = self._ids.get(entry)
+            try:
+                self.db.save_entry(snapshot)
+            except Exception as e:
+                self.failed.emit(entry, str(e) or type(e).__name__)
+            else:
+                self.saved.emit(entry, snapshot)
+            with self._cond:
+                if entry.id is None and snapshot.id is not None:
+                    self._ids[entry] = snapshot.id
+                self._active = None
+                self._cond.notify_all()